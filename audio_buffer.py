@@ -0,0 +1,94 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AudioRingBuffer:
+    """
+    会话的音频缓冲区：容量固定的 float32 数组，创建后不再分配内存。
+    内容始终保存在 data[start:end] 连续的一段中，读取返回视图，可以直接交给 ASR；
+    写入到数组末尾时把剩余内容移到开头（句子结束后剩余的音频通常很短）。
+    超出容量时丢弃最早的音频。
+    不加锁：extend、assign、clear 只能由会话的 process_session 串行调用（推理线程中，或两次推理之间），
+    其他线程只读取 nbytes 和 stats，读到的时长可能是近似值
+    """
+    def __init__(self, capacity, samplerate=16000):
+        self.capacity = int(capacity)
+        self.samplerate = samplerate
+        self.data = np.zeros(self.capacity, dtype=np.float32)
+        self.start = 0
+        self.end = 0
+        self.dropped_samples = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def view(self):
+        """
+        当前内容的视图，下一次 extend 或 assign 之后失效，需要在之后使用时调用方自行复制
+        """
+        return self.data[self.start:self.end]
+
+    def clear(self):
+        self.start = 0
+        self.end = 0
+
+    def extend(self, audio):
+        """
+        追加音频，返回追加后全部内容的视图
+        """
+        n = len(audio)
+        if n > self.capacity:
+            audio = audio[-self.capacity:]
+            self.dropped_samples += n - self.capacity
+            n = self.capacity
+
+        overflow = len(self) + n - self.capacity
+        if overflow > 0:
+            self.start += overflow
+            self.dropped_samples += overflow
+            logger.warning("Audio buffer full, drop oldest audio", extra={"fields": {
+                "samples": overflow, "capacity": self.capacity}})
+
+        if self.end + n > self.capacity:
+            size = len(self)
+            self.data[:size] = self.data[self.start:self.end]
+            self.start, self.end = 0, size
+
+        self.data[self.end:self.end + n] = audio
+        self.end += n
+        return self.view()
+
+    def assign(self, audio):
+        """
+        把内容设置为 audio：audio 是当前内容的后缀视图时（转录后裁掉已完成的句子）只移动起点，不复制
+        """
+        n = len(audio)
+        if n == 0:
+            self.clear()
+            return
+
+        itemsize = self.data.itemsize
+        offset = (audio.__array_interface__["data"][0] - self.data.__array_interface__["data"][0]) // itemsize
+        if audio.dtype == self.data.dtype and audio.strides == (itemsize,) \
+                and self.start <= offset and offset + n == self.end:
+            self.start = offset
+            return
+
+        self.clear()
+        self.extend(audio)
+
+    def stats(self):
+        # 推理线程可能正在移动内容，起点和终点不是同时更新的，时长只作为统计
+        size = min(max(self.end - self.start, 0), self.capacity)
+        return {
+            "buffer_seconds": round(size / self.samplerate, 3),
+            "capacity_seconds": round(self.capacity / self.samplerate, 3),
+            "buffer_bytes": self.nbytes,
+            "dropped_samples": self.dropped_samples,
+        }
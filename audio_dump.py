@@ -0,0 +1,167 @@
+import os
+import re
+import time
+import queue
+import atexit
+import shutil
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 格式名 -> (soundfile 格式, 编码, 扩展名)
+FORMATS = {
+    "wav": ("WAV", "FLOAT", "wav"),
+    "flac": ("FLAC", "PCM_16", "flac"),
+    "opus": ("OGG", "OPUS", "opus"),
+}
+
+# 轮转目录名，按创建时间命名
+ROTATION_DIR = re.compile(r"^\d{8}-\d{6}(-\d+)?$")
+# 会话编号（如 ip:port）中不能用作目录名的字符
+UNSAFE_CHARS = re.compile(r"[^\w.-]")
+# 记录句段编号的会话数上限，超出时淘汰最久未写入的会话
+MAX_SESSIONS = 4096
+
+
+class AudioDumpWriter:
+    """
+    缓存音频的后台写入：推理线程只把音频放入有界队列，队列满时丢弃而不是等待磁盘。
+    后台线程每次取出队列中已有的多段音频一起写入，文件路径为 轮转目录/会话/句段编号_类型.扩展名，
+    轮转目录超过 rotate_bytes 或 rotate_seconds 后新建，只保留最近 keep_dirs 个
+    """
+    def __init__(self, dump_config, samplerate=16000):
+        import soundfile
+        self.soundfile = soundfile
+
+        self.samplerate = samplerate
+        self.save_mode = dump_config.get("audio_save")
+        self.audio_dir = dump_config.get("audio_dir")
+        self.format, self.subtype, self.extension = FORMATS[dump_config.get("format", "wav")]
+        self.batch_size = dump_config.get("batch_size", 16)
+        self.rotate_bytes = dump_config.get("rotate_bytes")
+        self.rotate_seconds = dump_config.get("rotate_seconds")
+        self.keep_dirs = dump_config.get("keep_dirs")
+
+        self.queue = queue.Queue(maxsize=dump_config.get("queue_size", 256))
+        self.dropped = 0
+        self.written = 0
+
+        # 以下状态只在写入线程中访问
+        self.segments = OrderedDict()
+        self.session_dirs = set()
+        self.current_dir = None
+        self.dir_created = 0.0
+        self.dir_bytes = 0
+
+        self.thread = threading.Thread(target=self.run, name="audio-dump", daemon=True)
+        self.thread.start()
+        # 退出前写完队列中剩余的音频
+        atexit.register(self.close)
+
+    def submit(self, session_id, final, audio):
+        """
+        放入写入队列，不等待磁盘；audio 可能是会话缓冲区的视图，入队前复制。队列满时丢弃并返回 False
+        """
+        if self.save_mode == "final" and not final:
+            return False
+        if self.queue.full():
+            self.drop()
+            return False
+        try:
+            self.queue.put_nowait((session_id or "stateless", final, time.time(), np.array(audio, dtype=np.float32)))
+        except queue.Full:
+            self.drop()
+            return False
+        return True
+
+    def drop(self):
+        self.dropped += 1
+        metrics.inc("dump_dropped_total")
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning("Audio dump queue full, drop audio", extra={"fields": {"dropped": self.dropped}})
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            with metrics.timer("stage_seconds", stage="dump"):
+                for item in batch:
+                    if item is None:
+                        return
+                    try:
+                        self.write(*item)
+                    except Exception as e:
+                        logger.warning("Warning writing audio dump", extra={"fields": {"session": item[0], "error": e}})
+
+    def write(self, session_id, final, timestamp, audio):
+        directory = self.rotation_dir(timestamp)
+        session_dir = os.path.join(directory, UNSAFE_CHARS.sub("_", session_id))
+        if session_dir not in self.session_dirs:
+            os.makedirs(session_dir, exist_ok=True)
+            self.session_dirs.add(session_dir)
+
+        segment = self.segments.pop(session_id, 0) + 1
+        self.segments[session_id] = segment
+        if len(self.segments) > MAX_SESSIONS:
+            self.segments.popitem(last=False)
+
+        audio_path = os.path.join(session_dir, f"{segment:06d}_{'final' if final else 'partial'}.{self.extension}")
+        self.soundfile.write(audio_path, audio, self.samplerate, format=self.format, subtype=self.subtype)
+        self.dir_bytes += os.path.getsize(audio_path)
+        self.written += 1
+        metrics.inc("dump_written_total")
+
+    def rotation_dir(self, timestamp):
+        expired = (
+            self.current_dir is None
+            or (self.rotate_bytes and self.dir_bytes >= self.rotate_bytes)
+            or (self.rotate_seconds and timestamp - self.dir_created >= self.rotate_seconds)
+        )
+        if not expired:
+            return self.current_dir
+
+        name = time.strftime("%Y%m%d-%H%M%S", time.localtime(timestamp))
+        directory = os.path.join(self.audio_dir, name)
+        index = 0
+        while os.path.exists(directory):
+            index += 1
+            directory = os.path.join(self.audio_dir, f"{name}-{index}")
+        os.makedirs(directory)
+
+        self.current_dir = directory
+        self.dir_created = timestamp
+        self.dir_bytes = 0
+        self.session_dirs = set()
+        self.prune()
+        return directory
+
+    def prune(self):
+        if not self.keep_dirs:
+            return
+        # 只有当前目录会写入新的会话目录，按修改时间排序即按轮转顺序排序
+        rotation_dirs = sorted(
+            (entry.stat().st_mtime, entry.path) for entry in os.scandir(self.audio_dir)
+            if entry.is_dir() and ROTATION_DIR.match(entry.name)
+        )
+        for _, path in rotation_dirs[:-self.keep_dirs]:
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info("Remove rotated audio dump", extra={"fields": {"dir": path}})
+
+    def close(self, timeout=5.0):
+        if not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
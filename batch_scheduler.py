@@ -0,0 +1,240 @@
+import time
+import queue
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+import numpy as np
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.transcribe import get_suppressed_tokens
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 与 faster-whisper Segment 中 transcript 用到的字段保持一致
+BatchSegment = namedtuple("BatchSegment", ["start", "end", "text", "tokens", "avg_logprob", "no_speech_prob"])
+
+
+class BatchRequest:
+    def __init__(self, audio, initial_prompt, hotwords, prefix):
+        self.audio = audio
+        self.initial_prompt = initial_prompt
+        self.hotwords = hotwords
+        self.prefix = prefix
+        self.future = Future()
+        self.enqueue_time = time.monotonic()
+
+
+class BatchScheduler:
+    """
+    跨会话批量解码：在 max_wait_ms 时间窗口内收集各会话待转录的音频，
+    补齐到 30 秒后合并为一次 encoder 调用和一次 generate 调用，再把结果分发回各会话。
+    """
+    def __init__(self, asr_model, whisper_config, max_batch_size=8, max_wait_ms=80, start=True):
+        """
+        start 为 False 时不启动调度线程，只使用 decode_batch（离线批量转录由调用方自行组批）
+        """
+        self.asr_model = asr_model
+        self.whisper_config = whisper_config
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self.samplerate = asr_model.feature_extractor.sampling_rate
+        self.max_samples = asr_model.feature_extractor.chunk_length * self.samplerate
+        self.tokenizers = {}
+
+        self.queue = queue.Queue()
+        self.thread = None
+        if start:
+            self.thread = threading.Thread(target=self.run, name="batch-scheduler", daemon=True)
+            self.thread.start()
+
+    def transcribe(self, audio, initial_prompt=None, hotwords=None, prefix=None):
+        """
+        阻塞等待批量解码结果，在推理线程中调用
+        """
+        if len(audio) > self.max_samples:
+            # 超过一个解码窗口的音频无法补齐到同一批次，直接单独转录
+            segments, _ = self.asr_model.transcribe(
+                audio,
+                beam_size = self.whisper_config.get("beam_size"),
+                best_of = self.whisper_config.get("best_of"),
+                patience = self.whisper_config.get("patience"),
+                suppress_blank = self.whisper_config.get("suppress_blank"),
+                repetition_penalty = self.whisper_config.get("repetition_penalty"),
+                log_prob_threshold = self.whisper_config.get("log_prob_threshold"),
+                no_speech_threshold = self.whisper_config.get("no_speech_threshold"),
+                condition_on_previous_text = self.whisper_config.get("condition_on_previous_text"),
+                initial_prompt = initial_prompt,
+                hotwords = hotwords,
+                prefix = prefix,
+                temperature = self.whisper_config.get("temperature"),
+            )
+            return list(segments)
+
+        request = BatchRequest(audio, initial_prompt, hotwords, prefix)
+        self.queue.put(request)
+        return request.future.result()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = batch[0].enqueue_time + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            start_time = time.monotonic()
+            try:
+                results = self.decode_batch(batch)
+                for request, segments in zip(batch, results):
+                    request.future.set_result(segments)
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            latency = time.monotonic() - start_time
+            wait = start_time - batch[0].enqueue_time
+
+            # 批量解码的效果：批次大小、占满 max_batch_size 的比例、第一个请求的等待时间和解码耗时
+            metrics.observe("batch_size", len(batch))
+            metrics.observe("batch_occupancy", len(batch) / self.max_batch_size)
+            metrics.observe("stage_seconds", wait, stage="batch_wait")
+            metrics.observe("stage_seconds", latency, stage="batch_decode")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Batch decode", extra={"fields": {
+                    "size": len(batch),
+                    "max_batch_size": self.max_batch_size,
+                    "wait_ms": round(wait * 1000, 1),
+                    "latency_ms": round(latency * 1000, 1),
+                }})
+
+    def get_tokenizer(self, language):
+        if language not in self.tokenizers:
+            self.tokenizers[language] = Tokenizer(
+                self.asr_model.hf_tokenizer,
+                self.asr_model.model.is_multilingual,
+                task="transcribe",
+                language=language,
+            )
+        return self.tokenizers[language]
+
+    def detect_languages(self, encoder_output, batch_size):
+        if not self.asr_model.model.is_multilingual:
+            return ["en"] * batch_size
+
+        languages = []
+        for result in self.asr_model.model.detect_language(encoder_output):
+            language_token, _ = result[0]
+            languages.append(language_token[2:-2])
+        return languages
+
+    def decode_batch(self, batch):
+        whisper_config = self.whisper_config
+
+        # 每段音频单独提取特征后补齐到 30 秒，合并为一个批次
+        features = np.stack([
+            pad_or_trim(self.asr_model.feature_extractor(request.audio)[..., :-1])
+            for request in batch
+        ])
+        encoder_output = self.asr_model.encode(features)
+        languages = self.detect_languages(encoder_output, len(batch))
+
+        # 每个会话的 prompt 不同（hotwords 包含上一句），按会话分别构造
+        tokenizers = [self.get_tokenizer(language) for language in languages]
+        prompts = []
+        for request, tokenizer in zip(batch, tokenizers):
+            previous_tokens = []
+            if request.initial_prompt:
+                previous_tokens = tokenizer.encode(" " + request.initial_prompt.strip())
+            prompts.append(self.asr_model.get_prompt(
+                tokenizer,
+                previous_tokens,
+                without_timestamps=False,
+                prefix=request.prefix,
+                hotwords=request.hotwords or None,
+            ))
+
+        # 批量解码只使用 temperature 列表中的第一个值，不做温度回退
+        temperature = whisper_config.get("temperature")[0]
+        if temperature > 0:
+            decode_options = {
+                "beam_size": 1,
+                "sampling_topk": 0,
+                "sampling_temperature": temperature,
+            }
+        else:
+            decode_options = {
+                "beam_size": whisper_config.get("beam_size"),
+                "patience": whisper_config.get("patience"),
+            }
+
+        results = self.asr_model.model.generate(
+            encoder_output,
+            prompts,
+            length_penalty=1,
+            max_length=self.asr_model.max_length,
+            return_scores=True,
+            return_no_speech_prob=True,
+            suppress_blank=whisper_config.get("suppress_blank"),
+            suppress_tokens=get_suppressed_tokens(tokenizers[0], [-1]),
+            repetition_penalty=whisper_config.get("repetition_penalty"),
+            max_initial_timestamp_index=int(round(1.0 / self.asr_model.time_precision)),
+            **decode_options,
+        )
+
+        return [
+            self.split_segments(request, tokenizer, result)
+            for request, tokenizer, result in zip(batch, tokenizers, results)
+        ]
+
+    def split_segments(self, request, tokenizer, result):
+        tokens = result.sequences_ids[0]
+        avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+        no_speech_prob = result.no_speech_prob
+
+        # 与 faster-whisper 一致：无语音概率高且置信度低时视为静音
+        if (no_speech_prob > self.whisper_config.get("no_speech_threshold")
+                and avg_logprob < self.whisper_config.get("log_prob_threshold")):
+            return []
+
+        # 按时间戳 token 切分句子，<|0.00|> text <|2.40|><|2.40|> text <|5.00|>
+        duration = len(request.audio) / self.samplerate
+        time_precision = self.asr_model.time_precision
+        segments = []
+        start = None
+        text_tokens = []
+        for token in tokens:
+            if token >= tokenizer.timestamp_begin:
+                timestamp = (token - tokenizer.timestamp_begin) * time_precision
+                if start is not None and len(text_tokens) > 0:
+                    segments.append((start, min(timestamp, duration), text_tokens))
+                    start = None
+                    text_tokens = []
+                else:
+                    start = timestamp
+            elif token < tokenizer.eot:
+                text_tokens.append(token)
+
+        if len(text_tokens) > 0:
+            segments.append((start or 0.0, duration, text_tokens))
+
+        return [
+            BatchSegment(
+                start=start,
+                end=end,
+                text=tokenizer.decode(text_tokens),
+                tokens=text_tokens,
+                avg_logprob=avg_logprob,
+                no_speech_prob=no_speech_prob,
+            )
+            for start, end, text_tokens in segments
+        ]
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import numpy as np
+import librosa
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+
+SAMPLING_RATE = 16000
+
+DEFAULT_AUDIO = [
+    "./examples/speaker1_a_cn_16k.wav",
+    "./examples/speaker1_b_cn_16k.wav",
+    "./examples/speaker2_a_cn_16k.wav",
+    "./preheat_audio.wav",
+]
+
+# 回归判断的指标：耗时类指标越大越差
+COMPARE_METRICS = ["p50_ms", "p95_ms", "rtf"]
+
+
+class StageTimer:
+    """
+    记录每个阶段每次调用的耗时和处理的音频时长
+    """
+    def __init__(self):
+        self.latencies = {}
+        self.audio_seconds = {}
+
+    def run(self, stage, func, *args, audio_seconds=0.0):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        self.latencies.setdefault(stage, []).append(elapsed)
+        self.audio_seconds[stage] = self.audio_seconds.get(stage, 0.0) + audio_seconds
+        return result
+
+    def summary(self):
+        stages = {}
+        for stage, latencies in self.latencies.items():
+            latencies_ms = np.array(latencies) * 1000
+            audio_seconds = self.audio_seconds[stage]
+            stages[stage] = {
+                "count": len(latencies),
+                "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+                "mean_ms": round(float(np.mean(latencies_ms)), 3),
+                # 实时率：处理耗时 / 音频时长，不处理音频的阶段为 None
+                "rtf": round(float(np.sum(latencies)) / audio_seconds, 4) if audio_seconds > 0 else None,
+            }
+        return stages
+
+
+def peak_rss_mb():
+    # Linux 下 ru_maxrss 单位为 KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def load_chunks(audio_paths, chunk_size):
+    files = []
+    for path in audio_paths:
+        audio, _ = librosa.load(path, sr=SAMPLING_RATE, dtype=np.float32)
+        files.append((path, [audio[i:i + chunk_size] for i in range(0, len(audio), chunk_size)]))
+    return files
+
+
+def bench_stages(server, files, timer):
+    """
+    各阶段单独计时，每个音频块依次经过增强、VAD、转录、过滤、说话人识别和 Opus 编解码
+    """
+    from speech_enhance import EnhanceState
+    from opus_codec import OpusDecoder, OpusEncoder
+
+    transcriptor = server.transcriptor
+    frame_size = Config.opus.get("frame_size")
+    for path, chunks in files:
+        enhance_state = EnhanceState(SAMPLING_RATE, Config.speech_enhance.get("loudness_window"))
+        opus_encoder = OpusEncoder(SAMPLING_RATE, frame_size=frame_size)
+        opus_decoder = OpusDecoder(SAMPLING_RATE, frame_size=frame_size)
+        for chunk in chunks:
+            seconds = len(chunk) / SAMPLING_RATE
+
+            if transcriptor.speech_enhance is not None:
+                timer.run("enhance", transcriptor.speech_enhance.enhance, chunk, SAMPLING_RATE, audio_seconds=seconds)
+                timer.run("enhance_stream", transcriptor.speech_enhance.enhance_stream,
+                          chunk, SAMPLING_RATE, enhance_state, audio_seconds=seconds)
+
+            if transcriptor.vad_engine is not None:
+                timer.run("vad", transcriptor.vad_rm_silence, chunk, audio_seconds=seconds)
+
+            _, _, sentence, transcript, _ = timer.run(
+                "transcript", transcriptor.transcript, chunk, "guest", "", audio_seconds=seconds)
+            timer.run("filter", transcriptor.filter, sentence + transcript)
+
+            timer.run("speaker", transcriptor.speaker_verifier.match_speaker, chunk, audio_seconds=seconds)
+
+            opus_audio = timer.run("opus_encode", server.encode_audio, opus_encoder, chunk, audio_seconds=seconds)
+            timer.run("opus_decode", server.decode_audio, opus_decoder, opus_audio, audio_seconds=seconds)
+
+
+def bench_inference(server, files, timer):
+    """
+    按客户端的发送节奏回放整段音频，走服务端会话协议的完整推理路径
+    """
+    from session import Session
+
+    for path, chunks in files:
+        session = Session(
+            path,
+            cluster_config=Config.speaker_cluster if Config.speaker_cluster.get("enable") else None,
+            loudness_window=Config.speech_enhance.get("loudness_window"),
+            opus_config=Config.opus,
+            interruption_duration=Config.whisper_config.get("interruption_duration"),
+        )
+        for chunk in chunks:
+            timer.run("inference", server.handle_session_request, session, chunk,
+                      audio_seconds=len(chunk) / SAMPLING_RATE)
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """
+    与上一次的结果对比，指标变差超过 tolerance（相对值）且超过 min_delta_ms 时视为回归
+    """
+    regressions = []
+    for stage, current in results["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if previous is None:
+            continue
+        for metric in COMPARE_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if old is None or new is None or old <= 0:
+                continue
+            change = (new - old) / old
+            # rtf 没有绝对阈值，按 p50 的耗时差判断是否为噪声
+            delta_ms = new - old if metric.endswith("_ms") else current["p50_ms"] - previous["p50_ms"]
+            regressed = change > tolerance and delta_ms > min_delta_ms
+            print(f"{stage:>15} {metric:>7}: {old:10.4f} -> {new:10.4f} ({change * 100:+6.1f}%)"
+                  f"{'  REGRESSION' if regressed else ''}")
+            if regressed:
+                regressions.append((stage, metric))
+
+    old_rss, new_rss = baseline.get("peak_rss_mb"), results.get("peak_rss_mb")
+    if old_rss and new_rss:
+        change = (new_rss - old_rss) / old_rss
+        regressed = change > tolerance
+        print(f"{'peak_rss':>15} {'mb':>7}: {old_rss:10.1f} -> {new_rss:10.1f} ({change * 100:+6.1f}%)"
+              f"{'  REGRESSION' if regressed else ''}")
+        if regressed:
+            regressions.append(("peak_rss", "mb"))
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="推理流水线基准：各阶段和完整推理的延迟、实时率和内存峰值")
+    parser.add_argument("--audio", nargs="+", default=DEFAULT_AUDIO, help="回放的音频文件")
+    parser.add_argument("--chunk", type=int, default=16000, help="每次请求的采样点数，与客户端一致为 1 秒")
+    parser.add_argument("--repeat", type=int, default=1, help="重复次数")
+    parser.add_argument("--stub", action="store_true", help="使用 CPU 替身模型，不需要 GPU 和模型权重")
+    parser.add_argument("--output", default=None, help="结果保存为 JSON")
+    parser.add_argument("--baseline", default=None, help="与之前保存的 JSON 结果对比，出现回归时返回非零退出码")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许变差的相对比例")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="小于该耗时差的变化视为噪声")
+    args = parser.parse_args()
+
+    # 基准不写缓存音频，避免磁盘 IO 计入耗时
+    Config.dump["audio_save"] = "none"
+    if args.stub:
+        import stub_models
+        stub_models.install()
+        # 替身 embedding 不写入磁盘上的说话人索引
+        Config.models["speaker_verifier"]["index_dir"] = None
+
+    from web_server import WebServer
+    from transcriptor import Transcriptor
+
+    load_start = time.perf_counter()
+    server = WebServer(Transcriptor())
+    load_seconds = time.perf_counter() - load_start
+
+    files = load_chunks(args.audio, args.chunk)
+
+    timer = StageTimer()
+    for _ in range(args.repeat):
+        bench_stages(server, files, timer)
+        bench_inference(server, files, timer)
+
+    results = {
+        "stub": args.stub,
+        "chunk": args.chunk,
+        "repeat": args.repeat,
+        "audio": args.audio,
+        "audio_seconds": round(sum(len(chunk) for _, chunks in files for chunk in chunks) / SAMPLING_RATE, 3),
+        "load_seconds": round(load_seconds, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": timer.summary(),
+    }
+
+    print(f"{'stage':>15} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'rtf':>8}")
+    for stage, stats in results["stages"].items():
+        rtf = f"{stats['rtf']:.4f}" if stats["rtf"] is not None else "-"
+        print(f"{stage:>15} {stats['count']:>6} {stats['p50_ms']:>10.3f} {stats['p95_ms']:>10.3f} {rtf:>8}")
+    print(f"model load: {results['load_seconds']:.1f} s, peak rss: {results['peak_rss_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Save results: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} regressions against {args.baseline}")
+            sys.exit(1)
+        print(f"No regression against {args.baseline}")
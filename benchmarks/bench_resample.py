@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import librosa
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from resampler import resample, StreamResampler
+
+RATE_16K = 16000
+RATE_48K = 48000
+
+
+def run(name, func, chunks, repeat):
+    func(chunks[0])  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for chunk in chunks:
+            func(chunk)
+    elapsed = time.perf_counter() - start
+    audio_seconds = repeat * sum(len(chunk) for chunk in chunks) / RATE_16K
+    print(f"{name:>10}: {elapsed * 1000:9.1f} ms for {audio_seconds:.1f} s audio, "
+          f"{elapsed / audio_seconds * 1000:.3f} ms per audio second")
+    return elapsed
+
+
+def librosa_round_trip(chunk):
+    audio_48k = librosa.resample(chunk, orig_sr=RATE_16K, target_sr=RATE_48K)
+    return librosa.resample(audio_48k, orig_sr=RATE_48K, target_sr=RATE_16K)
+
+
+def polyphase_round_trip(chunk):
+    return resample(resample(chunk, RATE_16K, RATE_48K), RATE_48K, RATE_16K)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重采样基准：16k -> 48k -> 16k 往返，librosa vs 多相滤波")
+    parser.add_argument("--audio", default="./preheat_audio.wav", help="测试音频")
+    parser.add_argument("--chunk", type=int, default=16384, help="每块的采样点数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数")
+    args = parser.parse_args()
+
+    audio, _ = librosa.load(args.audio, sr=RATE_16K, dtype=np.float32)
+    chunks = [audio[i:i + args.chunk] for i in range(0, len(audio), args.chunk)]
+
+    upsampler = StreamResampler(RATE_16K, RATE_48K)
+    downsampler = StreamResampler(RATE_48K, RATE_16K)
+
+    def stream_round_trip(chunk):
+        return downsampler.process(upsampler.process(chunk))
+
+    librosa_time = run("librosa", librosa_round_trip, chunks, args.repeat)
+    polyphase_time = run("polyphase", polyphase_round_trip, chunks, args.repeat)
+    stream_time = run("stream", stream_round_trip, chunks, args.repeat)
+    print(f"speedup: polyphase {librosa_time / polyphase_time:.2f}x, stream {librosa_time / stream_time:.2f}x")
+
+    # 流式重采样拼接后与整段重采样的差异，衡量块边界的瞬态
+    upsampler.reset()
+    stream_48k = np.concatenate([upsampler.process(chunk) for chunk in chunks] + [upsampler.flush()])
+    whole_48k = resample(audio, RATE_16K, RATE_48K)
+    print(f"stream vs whole max abs diff: {np.max(np.abs(stream_48k - whole_48k)):.2e}")
@@ -0,0 +1,95 @@
+import os
+import sys
+import time
+import argparse
+from itertools import groupby
+import numpy as np
+import torch
+import librosa
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+from vad_engine import VadEngine
+
+EXAMPLES = [
+    "./examples/speaker1_a_cn_16k.wav",
+    "./examples/speaker1_b_cn_16k.wav",
+    "./examples/speaker2_a_cn_16k.wav",
+]
+
+
+def legacy_vad_rm_silence(vad_model, audio_chunk):
+    """
+    旧版 Transcriptor.vad_rm_silence：逐窗口调用模型，逐段拼接 Python 列表
+    """
+    vad_config = Config.vad
+
+    vad_flags = []
+    chunk_num = len(audio_chunk) // 512
+    sampling_rate = vad_config.get("sampling_rate")
+    sampling_per_chunk = vad_config.get("sampling_per_chunk")
+
+    for i in range(chunk_num):
+        chunk = audio_chunk[i*sampling_per_chunk:(i+1)*sampling_per_chunk]
+        chunk_torch = torch.tensor(chunk).unsqueeze(0)
+        silero_score = vad_model(chunk_torch, sampling_rate).item()
+        vad_flags.append(1 if silero_score > vad_config.get("vad_threshold") else 0)
+
+    if vad_flags.count(1) < vad_config.get("min_voice_duration"):
+        return None
+    if vad_flags.count(0) < vad_config.get("min_silence_duration"):
+        return audio_chunk
+
+    silence_reserve = vad_config.get("silence_reserve")
+    indices = []
+    for flag, group in groupby(enumerate(vad_flags), lambda x: x[1]):
+        if flag == 1:
+            group = list(group)
+            indices.append((group[0][0], group[-1][0]))
+
+    split_chunk = []
+    for start, end in indices:
+        start_sample = max(0, (start - silence_reserve) * sampling_per_chunk)
+        end_sample = min(len(audio_chunk), (end + 1 + silence_reserve) * sampling_per_chunk)
+        split_chunk.extend(audio_chunk[start_sample:end_sample])
+
+    if len(split_chunk) > 0:
+        return np.array(split_chunk, dtype=np.float32)
+    return None
+
+
+def run(name, func, chunks, repeat):
+    func(chunks[0])  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for chunk in chunks:
+            func(chunk)
+    elapsed = time.perf_counter() - start
+    audio_seconds = repeat * sum(len(chunk) for chunk in chunks) / Config.vad.get("sampling_rate")
+    print(f"{name:>8}: {elapsed * 1000:9.1f} ms for {audio_seconds:.1f} s audio, "
+          f"{elapsed / audio_seconds * 1000:.3f} ms per audio second")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VAD 微基准：旧版逐窗口实现 vs VadEngine")
+    parser.add_argument("--chunk", type=int, default=16384, help="每次推理的采样点数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数")
+    args = parser.parse_args()
+
+    vad_model, _ = torch.hub.load(
+        repo_or_dir = Config.models["vad"]["path"],
+        model = 'silero_vad',
+        trust_repo = None,
+        source = 'local',
+    )
+    vad_engine = VadEngine(vad_model, Config.vad)
+
+    chunks = []
+    for path in EXAMPLES:
+        audio, _ = librosa.load(path, sr=Config.vad.get("sampling_rate"), dtype=np.float32)
+        chunks.extend(audio[i:i + args.chunk] for i in range(0, len(audio), args.chunk))
+
+    legacy_time = run("legacy", lambda chunk: legacy_vad_rm_silence(vad_model, chunk), chunks, args.repeat)
+    engine_time = run("engine", vad_engine.remove_silence, chunks, args.repeat)
+    print(f"speedup: {legacy_time / engine_time:.2f}x")
@@ -0,0 +1,145 @@
+"""
+CPU 替身模型：替换 Whisper、ClearVoice、ERes2Net 和 Silero 的模型对象，外层的封装类照常构造和运行，
+不需要 GPU 和模型权重。替身的计算量与音频长度成正比，用于回归对比，不代表真实模型的耗时。
+"""
+from collections import namedtuple
+import numpy as np
+import torch
+import librosa
+
+SAMPLING_RATE = 16000
+EMBEDDING_DIM = 192
+
+StubSegment = namedtuple("StubSegment", ["start", "end", "text", "avg_logprob", "no_speech_prob", "words"])
+StubWord = namedtuple("StubWord", ["start", "end", "word"])
+StubInfo = namedtuple("StubInfo", ["language", "language_probability", "duration"])
+
+STUB_TEXT = "大家好这是一段测试录音。"
+
+
+def frame_energy(audio_np, frame_size):
+    num_frames = len(audio_np) // frame_size
+    frames = np.asarray(audio_np[:num_frames * frame_size], dtype=np.float32).reshape(num_frames, frame_size)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+class StubWhisperModel:
+    """
+    每 4 秒音频生成一段固定文本，计算一次与 Whisper 相同帧长帧移的频谱
+    """
+    def __init__(self, model_size_or_path=None, device=None, compute_type=None, **kwargs):
+        self.frame_size = 400
+        self.hop_size = 160
+        self.window = np.hanning(self.frame_size).astype(np.float32)
+
+    def spectrum(self, audio_np):
+        num_frames = max(0, (len(audio_np) - self.frame_size) // self.hop_size + 1)
+        if num_frames == 0:
+            return np.zeros((0, self.frame_size // 2 + 1), dtype=np.float32)
+        frames = np.lib.stride_tricks.sliding_window_view(audio_np, self.frame_size)[::self.hop_size][:num_frames]
+        return np.abs(np.fft.rfft(frames * self.window, axis=1))
+
+    def transcribe(self, audio, word_timestamps=False, **kwargs):
+        audio = np.asarray(audio, dtype=np.float32)
+        self.spectrum(audio)
+
+        duration = len(audio) / SAMPLING_RATE
+        segment_duration = 4.0
+        segments = []
+        start = 0.0
+        while start < duration - 0.5:
+            end = min(duration, start + segment_duration)
+            num_chars = max(1, int((end - start) * 3))
+            text = (STUB_TEXT * (num_chars // len(STUB_TEXT) + 1))[:num_chars]
+            words = None
+            if word_timestamps:
+                step = (end - start) / len(text)
+                words = [StubWord(start + i * step, start + (i + 1) * step, char) for i, char in enumerate(text)]
+            segments.append(StubSegment(start, end, text, -0.3, 0.01, words))
+            start = end
+
+        return iter(segments), StubInfo("zh", 1.0, duration)
+
+
+class StubClearVoice:
+    """
+    一阶高通滤波代替语音增强模型，输入输出形状与 ClearVoice 一致
+    """
+    def __init__(self, task=None, model_names=None):
+        pass
+
+    def __call__(self, audio_np):
+        audio_np = np.asarray(audio_np, dtype=np.float32)
+        output = audio_np.copy()
+        output[:, 1:] -= 0.95 * audio_np[:, :-1]
+        return output
+
+
+class StubSpeakerPipeline:
+    """
+    频谱投影到固定随机矩阵作为说话人 embedding，相同音频的 embedding 相同
+    """
+    def __init__(self, task=None, model=None):
+        rng = np.random.default_rng(0)
+        self.projection = rng.standard_normal((257, EMBEDDING_DIM)).astype(np.float32)
+
+    def load(self, audio):
+        if isinstance(audio, str):
+            audio, _ = librosa.load(audio, sr=SAMPLING_RATE, dtype=np.float32)
+        return np.asarray(audio, dtype=np.float32)
+
+    def embed(self, audio):
+        audio = self.load(audio)
+        num_frames = len(audio) // 512
+        if num_frames == 0:
+            return np.zeros(EMBEDDING_DIM, dtype=np.float32)
+        frames = audio[:num_frames * 512].reshape(num_frames, 512)
+        spectrum = np.log1p(np.abs(np.fft.rfft(frames, axis=1))).mean(axis=0)
+        return spectrum @ self.projection
+
+    def __call__(self, inputs, output_emb=False, thr=None):
+        embeddings = [self.embed(audio) for audio in inputs]
+        if output_emb:
+            return {"embs": np.stack(embeddings)}
+        a, b = embeddings[0], embeddings[1]
+        return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
+
+
+class StubSileroVad(torch.nn.Module):
+    """
+    按窗口能量给出语音概率，提供与新版 silero jit 模型相同的 audio_forward 接口
+    """
+    def __init__(self, window_size=512):
+        super().__init__()
+        self.window_size = window_size
+
+    def reset_states(self):
+        pass
+
+    def audio_forward(self, x, sr):
+        energy = frame_energy(x.reshape(-1).numpy(), self.window_size)
+        db = 20 * np.log10(energy + 1e-10)
+        # -50 dBFS 以下接近 0，-30 dBFS 以上接近 1
+        scores = 1.0 / (1.0 + np.exp(-(db + 40.0) / 3.0))
+        return torch.from_numpy(scores.astype(np.float32)).unsqueeze(0)
+
+    def forward(self, x, sr):
+        return self.audio_forward(x, sr)[:, :1]
+
+
+def stub_hub_load(repo_or_dir=None, model=None, **kwargs):
+    return StubSileroVad(), None
+
+
+def install():
+    """
+    替换各模块引用的模型构造函数，必须在构造 Transcriptor / WebServer 之前调用
+    """
+    import transcriptor
+    import speech_enhance
+    import speaker_recognize
+
+    transcriptor.WhisperModel = StubWhisperModel
+    speech_enhance.ClearVoice = StubClearVoice
+    speaker_recognize.pipeline = StubSpeakerPipeline
+    torch.hub.load = stub_hub_load
@@ -0,0 +1,278 @@
+import os
+import json
+import glob
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+import librosa
+from faster_whisper import WhisperModel
+
+from config import Config
+from batch_scheduler import BatchScheduler, BatchRequest
+from text_filter import HallucinationFilter
+from speaker_cluster import SpeakerClusters
+from logger import setup_logging
+
+SAMPLING_RATE = 16000
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".m4a", ".ogg", ".opus")
+
+# 进程池中每个进程各自加载一次的模型
+worker_models = {}
+
+
+def init_worker():
+    """
+    进程池初始化：加载语音增强和说话人识别模型
+    """
+    from speaker_recognize import SpeakerVerifier
+    from speech_enhance import SpeechEnhance
+
+    se_config = Config.speech_enhance
+    if se_config.get("enable"):
+        worker_models["speech_enhance"] = SpeechEnhance(
+            model_name=se_config.get("model_name"),
+            target_lufs=se_config.get("target_lufs"),
+            true_peak_limit=se_config.get("true_peak_limit"),
+            mute_if_too_quiet=se_config.get("mute_if_too_quiet"),
+            threshold_dbfs=se_config.get("threshold_dbfs"),
+            model_samplerate=se_config.get("model_samplerate"),
+            context_duration=se_config.get("context_duration"),
+            overlap_duration=se_config.get("overlap_duration"),
+        )
+    worker_models["speaker_verifier"] = SpeakerVerifier()
+
+
+def load_and_enhance(audio_path, piece_duration):
+    """
+    读取音频并按片段流式增强，片段之间保持上下文和响度状态，输出与输入时间对齐
+    """
+    from speech_enhance import EnhanceState
+
+    audio, _ = librosa.load(audio_path, sr=SAMPLING_RATE, dtype=np.float32)
+
+    speech_enhance = worker_models.get("speech_enhance")
+    if speech_enhance is None:
+        return audio
+
+    state = EnhanceState(SAMPLING_RATE, Config.speech_enhance.get("loudness_window"))
+    piece_size = int(piece_duration * SAMPLING_RATE)
+    enhanced = [
+        speech_enhance.enhance_stream(audio[i:i + piece_size], SAMPLING_RATE, state)
+        for i in range(0, len(audio), piece_size)
+    ]
+    enhanced = np.concatenate(enhanced) if len(enhanced) > 0 else audio[:0]
+
+    # 流式增强保留的尾部不再输出，用静音补齐保持时长一致
+    return np.pad(enhanced, (0, max(0, len(audio) - len(enhanced))))[:len(audio)]
+
+
+def embed_segments(audio_segments):
+    speaker_verifier = worker_models["speaker_verifier"]
+    return [speaker_verifier.embed(segment) for segment in audio_segments]
+
+
+def format_srt_time(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+
+def collect_audio_files(inputs):
+    audio_files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for file_path in sorted(glob.glob(os.path.join(path, "**", "*"), recursive=True)):
+                if file_path.lower().endswith(AUDIO_EXTENSIONS):
+                    audio_files.append(file_path)
+        else:
+            audio_files.append(path)
+    return audio_files
+
+
+class BulkTranscriptor:
+    """
+    离线批量转录：整段音频先做 VAD 切分语音段，语音段按批次送入 Whisper，
+    语音增强和说话人 embedding 在进程池中并行处理
+    """
+    def __init__(self, workers=2, batch_size=8):
+        self.batch_size = batch_size
+        self.whisper_config = Config.whisper_config
+        self.bulk_config = Config.bulk_transcribe
+
+        asr_config = Config.models["asr"]
+        self.asr_model = WhisperModel(
+            model_size_or_path = asr_config["path"],
+            device = asr_config["device"],
+            local_files_only = False,
+            compute_type = asr_config["compute_type"],
+            num_workers = asr_config.get("num_workers", 1)
+        )
+        # 语音段由 transcribe_segments 自行组批，只使用 decode_batch，不启动调度线程
+        self.batch_scheduler = BatchScheduler(self.asr_model, self.whisper_config, max_batch_size=batch_size, start=False)
+
+        self.vad_model, vad_utils = torch.hub.load(
+            repo_or_dir = Config.models["vad"]["path"],
+            model = 'silero_vad',
+            trust_repo = None,
+            source = 'local',
+        )
+        self.get_speech_timestamps = vad_utils[0]
+
+        self.text_filter = HallucinationFilter(Config.filter_match) if Config.filter_match.get("enable") else None
+        if self.whisper_config.get("tradition_to_simple"):
+            import opencc
+            self.cc_model = opencc.OpenCC('t2s.json')
+        else:
+            self.cc_model = None
+
+        # 模型在子进程中加载，spawn 避免继承 CUDA 上下文
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+
+    def speech_segments(self, audio):
+        """
+        整段音频做 VAD，返回语音段的起止采样点，每段不超过 interruption_duration
+        """
+        vad_config = Config.vad
+        window_ms = vad_config.get("sampling_per_chunk") * 1000 // vad_config.get("sampling_rate")
+        timestamps = self.get_speech_timestamps(
+            torch.from_numpy(audio),
+            self.vad_model,
+            threshold = vad_config.get("vad_threshold"),
+            sampling_rate = SAMPLING_RATE,
+            min_silence_duration_ms = vad_config.get("min_silence_duration") * window_ms,
+            min_speech_duration_ms = vad_config.get("min_voice_duration") * window_ms,
+            speech_pad_ms = vad_config.get("silence_reserve") * window_ms,
+            max_speech_duration_s = self.whisper_config.get("interruption_duration"),
+        )
+        return [(item["start"], item["end"]) for item in timestamps]
+
+    def transcribe_segments(self, audio, segments):
+        """
+        语音段按批次解码，返回 (语音段序号, 开始时间, 结束时间, 文本)
+        """
+        initial_prompt = self.whisper_config.get("initial_prompt")
+        hotwords = self.whisper_config.get("hotwords_text")
+
+        results = []
+        for batch_start in range(0, len(segments), self.batch_size):
+            batch_segments = segments[batch_start:batch_start + self.batch_size]
+            batch = [BatchRequest(audio[start:end], initial_prompt, hotwords, None) for start, end in batch_segments]
+            for offset, ((start, end), decoded) in enumerate(zip(batch_segments, self.batch_scheduler.decode_batch(batch))):
+                for segment in decoded:
+                    if segment.avg_logprob <= self.whisper_config.get("log_prob_threshold"):
+                        continue
+                    text = segment.text.strip()
+                    if self.cc_model is not None:
+                        text = self.cc_model.convert(text)
+                    if self.text_filter is not None:
+                        text = self.text_filter.filter(text)
+                    if len(text) == 0:
+                        continue
+                    results.append((
+                        batch_start + offset,
+                        start / SAMPLING_RATE + segment.start,
+                        min(start / SAMPLING_RATE + segment.end, end / SAMPLING_RATE),
+                        text,
+                    ))
+        return results
+
+    def assign_speakers(self, embeddings, durations):
+        """
+        匹配注册说话人，未匹配的语音段在文件内聚类为 guest_N，过短的语音段沿用上一个说话人
+        """
+        from speaker_index import SpeakerIndex
+
+        sv_config = Config.models["speaker_verifier"]
+        match_threshold = sv_config.get("match_threshold", 0.3)
+        speaker_index = SpeakerIndex(sv_config.get("index_dir"), sv_config.get("aggregate", "max"))
+        clusters = SpeakerClusters(Config.speaker_cluster) if Config.speaker_cluster.get("enable") else None
+
+        speakers = []
+        last_speaker = "guest"
+        for embedding, duration in zip(embeddings, durations):
+            speaker = last_speaker
+            if duration >= self.bulk_config.get("min_speaker_duration"):
+                speaker_id, score = speaker_index.search(embedding) if len(speaker_index) > 0 else (None, -1.0)
+                if score >= match_threshold:
+                    speaker = speaker_id
+                elif clusters is not None:
+                    speaker = clusters.assign(embedding)
+                else:
+                    speaker = "guest"
+            speakers.append(speaker)
+            last_speaker = speaker
+        return speakers
+
+    def transcribe_files(self, audio_files, output_dir, formats):
+        os.makedirs(output_dir, exist_ok=True)
+        piece_duration = self.bulk_config.get("enhance_piece_duration")
+
+        # 只预取下一个文件：当前文件转录时下一个文件在进程池中增强，内存中最多同时有两个文件的音频
+        enhance_future = self.pool.submit(load_and_enhance, audio_files[0], piece_duration) if audio_files else None
+
+        for index, audio_path in enumerate(audio_files):
+            audio = enhance_future.result()
+            if index + 1 < len(audio_files):
+                enhance_future = self.pool.submit(load_and_enhance, audio_files[index + 1], piece_duration)
+            segments = self.speech_segments(audio)
+            print(f"{audio_path}: {len(audio) / SAMPLING_RATE:.1f}s audio, {len(segments)} speech segments")
+
+            embed_future = self.pool.submit(embed_segments, [audio[start:end] for start, end in segments])
+            lines = self.transcribe_segments(audio, segments)
+            speakers = self.assign_speakers(
+                embed_future.result(),
+                [(end - start) / SAMPLING_RATE for start, end in segments],
+            )
+
+            self.write_outputs(audio_path, output_dir, formats, [
+                {"start": round(start, 3), "end": round(end, 3), "speaker": speakers[index], "text": text}
+                for index, start, end, text in lines
+            ])
+
+    def write_outputs(self, audio_path, output_dir, formats, lines):
+        file_name = os.path.splitext(os.path.basename(audio_path))[0]
+
+        if "jsonl" in formats:
+            with open(os.path.join(output_dir, file_name + ".jsonl"), "w", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(json.dumps(dict(line, file=audio_path), ensure_ascii=False) + "\n")
+
+        if "srt" in formats:
+            with open(os.path.join(output_dir, file_name + ".srt"), "w", encoding="utf-8") as f:
+                for i, line in enumerate(lines):
+                    f.write(f"{i + 1}\n")
+                    f.write(f"{format_srt_time(line['start'])} --> {format_srt_time(line['end'])}\n")
+                    f.write(f"{line['speaker']}: {line['text']}\n\n")
+
+    def close(self):
+        self.pool.shutdown()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    bulk_config = Config.bulk_transcribe
+
+    parser = argparse.ArgumentParser(description="离线批量转录音频文件或目录")
+    parser.add_argument("inputs", nargs="+", help="音频文件或目录")
+    parser.add_argument("--output-dir", default="./transcripts", help="输出目录")
+    parser.add_argument("--format", nargs="+", default=["jsonl", "srt"], choices=["jsonl", "srt"], help="输出格式")
+    parser.add_argument("--workers", type=int, default=bulk_config.get("workers"), help="增强和说话人识别的进程数")
+    parser.add_argument("--batch-size", type=int, default=bulk_config.get("batch_size"), help="Whisper 批量解码大小")
+    args = parser.parse_args()
+
+    audio_files = collect_audio_files(args.inputs)
+    print(f"Transcribe {len(audio_files)} files")
+
+    bulk_transcriptor = BulkTranscriptor(workers=args.workers, batch_size=args.batch_size)
+    try:
+        bulk_transcriptor.transcribe_files(audio_files, args.output_dir, args.format)
+    finally:
+        bulk_transcriptor.close()
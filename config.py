@@ -9,7 +9,8 @@ class Config:
             "name": "faster-whisper",
             "path": os.path.join(model_path, "faster-whisper-large-v3-turbo"),
             "compute_type": "float16",
-            "device": "cuda"
+            "device": "cuda",
+            "num_workers": 2            # 与 server.inference_workers 一致，允许多个线程并行转录
         },
         "vad": {
             "name": "silero",
@@ -20,6 +21,9 @@ class Config:
         "speaker_verifier": {
             "name": "ERes2NetV2",
             "path": os.path.join(model_path, "ERes2NetV2_w24s4ep4"),
+            "index_dir": os.path.join(registers_path, "index"),  # 注册说话人 embedding 索引目录，None 则不保存到磁盘
+            "aggregate": "max",     # 一个说话人有多段注册音频时的打分方式，max: 取最大值，centroid: 与中心比较
+            "match_threshold": 0.3, # 与注册说话人的相似度不低于该值时视为同一人，实时转录和离线批量转录共用
             "speakers": [
                 # 注册说话人，格式：
                 # { "id": "speaker1", "path": os.path.join(registers_path, "speaker1_a_cn_16k.wav") },
@@ -28,11 +32,102 @@ class Config:
         }
     }
 
+    speaker_cluster = {
+        "enable": False,            # 未注册或未匹配的说话人按会话在线聚类为 guest_1、guest_2 ...，关闭时统一为 guest
+        "assign_threshold": 0.4,    # 与聚类中心相似度不低于该值则归入该聚类，否则新建聚类
+        "merge_threshold": 0.6,     # 两个聚类中心相似度不低于该值则合并
+        "split_threshold": 0.2,     # 聚类内 2-means 两组中心相似度低于该值则拆分
+        "max_members": 20,          # 每个聚类保留最近的 embedding 数，用于拆分
+        "min_split_members": 6,     # 聚类成员数不少于该值才尝试拆分
+    }
+
     preheat_audio = "./preheat_audio.wav"
 
+    # 每个会话独立的 Opus 编解码器
+    opus = {
+        "frame_size": 320,              # 每个 Opus 包的采样点数，20ms
+        "jitter_frames": 2,             # 协议 2 的帧序号不连续时最多缓存的帧数，超出后视为丢失
+        "max_conceal_packets": 16,      # 丢失的帧最多用 FEC/PLC 补齐的包数，320ms
+        "jitter_timeout": 1.0,          # 抖动缓冲中有等待的帧且该时长内没有新的帧时，补齐缺失的帧并全部输出，单位：秒
+    }
+
+    server = {
+        "inference_workers": 2,         # 推理线程数，不同会话的推理可以并行
+        "load_workers": 4,              # 启动时并行加载和预热模型的线程数
+        "max_pending_duration": 5,      # 每个会话最多积压的音频时长，单位：秒，超出时丢弃最早的音频
+        "async_speaker": False,         # 完整句子先返回临时说话人，识别完成后推送 speaker_update 消息
+        "result_cache_size": 1024,      # 缓存最近的推理结果数，客户端重传的音频直接返回缓存的结果，0 为不缓存
+    }
+
+    # 多进程部署：python router.py 在 6002 端口接受连接，每个连接固定转发给一个 worker 进程，
+    # 每个 worker 是一个加载了全部模型的 web_server.py
+    router = {
+        "workers": [
+            # gpu: worker 的 CUDA_VISIBLE_DEVICES，cpus: 绑定的 CPU 核，如 "0-7"，None 表示不绑定
+            {"gpu": "0", "cpus": None},
+            {"gpu": "1", "cpus": None},
+        ],
+        "socket_dir": "/tmp/transcriptor",  # worker 监听的 unix socket 目录
+        "metrics_port_base": 6010,      # worker i 的运行指标端口为 metrics_port_base + i
+        "health_interval": 2.0,         # 健康检查间隔，单位：秒
+        "health_timeout": 2.0,          # 健康检查超时，单位：秒
+        "max_failures": 3,              # 健康检查连续失败次数，达到后结束并重启 worker
+        "startup_timeout": 120,         # worker 启动后该时间内 socket 未就绪不计为失败，单位：秒
+        "restart_delay": 5.0,           # worker 退出后等待该时间再重启，单位：秒
+    }
+
+    logging = {
+        "level": "INFO",    # DEBUG 时输出每次请求和实时转录结果
+        "format": "text",   # text: key=value 格式，json: 每行一个 JSON 对象
+    }
+
+    metrics = {
+        "enable": True,     # 记录各阶段延迟、实时率、会话和队列状态
+        "port": 6003,       # Prometheus 指标 HTTP 端口，GET /metrics
+    }
+
+    low_latency = {
+        "greedy_partial": True,         # 实时转录结果使用贪心解码，句子结束时用 whisper_config 的 beam 设置重新解码整句
+        "end_silence_duration": 1.0,    # 连续静音达到该时长才结束句子，单位：秒，客户端发送小于 1 秒的音频块时生效
+    }
+
+    adaptive_decode = {
+        "enable": False,            # 根据负载自适应降低解码档位：full -> greedy_partial -> small_beam -> no_fallback
+        "target_rtf": 0.5,          # 目标实时率（推理耗时 / 音频时长）
+        "degrade_threshold": 1.0,   # 负载（实时率 / target_rtf 与 队列深度 / inference_workers 取大者）超过该值时降低一档
+        "restore_threshold": 0.6,   # 负载低于该值时恢复一档
+        "min_interval": 2.0,        # 两次调整档位的最小间隔，单位：秒
+        "rtf_smoothing": 0.2,       # 实时率的指数平滑系数
+        "max_tier": 3,              # 最低允许降到的档位
+    }
+
+    batch_decode = {
+        "enable": False,        # 跨会话批量解码，只使用 temperature 的第一个值，不做温度回退
+        "max_batch_size": 8,    # 每批最多会话数，server.inference_workers 需不小于该值才能凑满一批
+        "max_wait_ms": 80,      # 收集批次的最长等待时间，单位：毫秒
+    }
+
+    streaming_decode = {
+        "enable": False,            # LocalAgreement-2 流式解码，只转录未确认的音频，仅服务端会话协议生效
+        "max_prompt_chars": 200,    # 已确认文本作为 initial_prompt 上文的最大字数
+    }
+
+    bulk_transcribe = {
+        "workers": 2,                   # 语音增强和说话人 embedding 的进程数，每个进程各自加载一份模型
+        "batch_size": 8,                # 每批送入 Whisper 的语音段数
+        "enhance_piece_duration": 10,   # 整段音频按该时长分片流式增强，单位：秒
+        "min_speaker_duration": 1.0,    # 短于该时长的语音段不做说话人识别，沿用上一段的说话人，单位：秒
+    }
+
     dump = {
         "audio_save": "none",  # all: 保存所有音频，final: 只保存最终音频, none: 不保存
-        "audio_dir": "./cache"
+        "audio_dir": "./cache",
+        "format": "wav",            # wav: float32 无压缩，flac: 16 位无损压缩，opus: 有损压缩
+        "queue_size": 256,          # 等待写入的音频段数，队列满时丢弃，不阻塞推理
+        "batch_size": 16,           # 后台线程每次最多连续写入的音频段数
+        "rotate_bytes": 1 << 30,    # 轮转目录超过该大小后新建目录，None 不按大小轮转
+        "rotate_seconds": 86400,    # 轮转目录创建超过该时长后新建目录，单位：秒，None 不按时间轮转
+        "keep_dirs": 7,             # 只保留最近的轮转目录数，None 全部保留
     }
 
     speech_enhance = {
@@ -42,6 +137,18 @@ class Config:
         "true_peak_limit": -1.0,
         "mute_if_too_quiet": True,
         "threshold_dbfs": -50,
+        "model_samplerate": 48000,      # 模型采样率，使用 16kHz 模型时设为 16000 可跳过两次重采样
+        "streaming": True,              # 流式增强：块间保持上下文并重叠相加，响度按会话累积测量，仅服务端会话协议生效
+        "context_duration": 0.5,        # 每块增强时带上的上一块尾部时长，单位：秒
+        "overlap_duration": 0.05,       # 相邻块交叉淡化的时长，单位：秒
+        "loudness_window": 10,          # 门限响度积分的时间窗口，单位：秒
+    }
+
+    pre_gate = {
+        "enable": True,
+        "rms_threshold_dbfs": -55,  # 原始音频 RMS 低于该值视为静音，跳过增强、VAD 和转录
+        "use_vad": True,            # 原始音频再做一次 VAD，语音窗口数少于 vad.min_voice_duration 视为静音
+        "vad_threshold": 0.1,       # 预门限的 VAD 阈值，低于 vad.vad_threshold 以免误判噪声下的语音
     }
 
     vad = {
@@ -52,6 +159,7 @@ class Config:
         "min_silence_duration": 12,        # 12 * 31.25ms = 375ms
         "min_voice_duration": 8,           # 8 * 31.25ms = 250ms
         "silence_reserve": 6,              # 6 * 31.25ms = 187.5ms
+        "reference_duration": 1.0,         # 以上时长按 1 秒的音频块设置，更短的音频块按窗口数等比例缩小
     }
 
     filter_match = {
@@ -66,7 +174,10 @@ class Config:
             "优优独播剧场——YoYo Television Series Exclusive",
             "中文字幕——Yo Television Series Exclusive"
         ],
-        "cos_sim": 0.02
+        "cos_sim": 0.5,             # 字符 n-gram TF-IDF 余弦相似度阈值，高于该值则过滤
+        "ngram_range": (2, 3),      # 字符 n-gram 长度范围
+        "blacklist_path": "./filter_blacklist.json",  # 黑名单文件，存在时覆盖 find_match 和 cos_match，修改后自动重新加载
+        "reload_interval": 5,       # 检查黑名单文件是否修改的间隔，单位：秒
     }
 
     whisper_config = {
@@ -0,0 +1,82 @@
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 贪心解码：beam_size=1，不做温度回退
+GREEDY = {"beam_size": 1, "best_of": 1, "fallback": False}
+
+# 解码档位，按负载从低到高排列。partial 为实时转录结果的解码设置，final 为句子结束时重新解码整句的设置，
+# None 表示使用 whisper_config 的设置
+TIERS = [
+    {"name": "full", "partial": None, "final": None},
+    {"name": "greedy_partial", "partial": GREEDY, "final": None},
+    {"name": "small_beam", "partial": GREEDY, "final": {"beam_size": 4, "best_of": 2, "fallback": True}},
+    {"name": "no_fallback", "partial": GREEDY, "final": {"beam_size": 2, "best_of": 1, "fallback": False}},
+]
+
+
+class DecodeBudget:
+    """
+    根据推理线程池的队列深度和实测实时率自适应选择解码档位：负载高时逐级降低，负载下降后逐级恢复。
+    负载 = max(平滑实时率 / target_rtf, 队列深度 / inference_workers)
+    """
+    def __init__(self, budget_config, inference_workers=1):
+        self.target_rtf = budget_config.get("target_rtf")
+        self.degrade_threshold = budget_config.get("degrade_threshold")
+        self.restore_threshold = budget_config.get("restore_threshold")
+        self.min_interval = budget_config.get("min_interval")
+        self.rtf_smoothing = budget_config.get("rtf_smoothing")
+        self.max_tier = min(budget_config.get("max_tier", len(TIERS) - 1), len(TIERS) - 1)
+        self.inference_workers = max(1, inference_workers)
+
+        self.lock = threading.Lock()
+        self.tier = 0
+        self.rtf = 0.0
+        self.queue_depth = 0
+        self.last_change = time.monotonic()
+
+    @property
+    def tier_name(self):
+        return TIERS[self.tier]["name"]
+
+    def load(self):
+        return max(self.rtf / self.target_rtf, self.queue_depth / self.inference_workers)
+
+    def update_rtf(self, rtf):
+        with self.lock:
+            self.rtf += self.rtf_smoothing * (rtf - self.rtf)
+            self.evaluate()
+
+    def update_queue_depth(self, queue_depth):
+        with self.lock:
+            self.queue_depth = queue_depth
+            self.evaluate()
+
+    def evaluate(self):
+        # 每次最多调整一级，两次调整之间至少间隔 min_interval，避免在两个档位之间来回切换
+        now = time.monotonic()
+        if now - self.last_change < self.min_interval:
+            return
+
+        load = self.load()
+        if load > self.degrade_threshold and self.tier < self.max_tier:
+            self.tier += 1
+        elif load < self.restore_threshold and self.tier > 0:
+            self.tier -= 1
+        else:
+            return
+
+        self.last_change = now
+        logger.info("Decode tier changed", extra={"fields": {
+            "tier": self.tier_name, "load": round(load, 3), "rtf": round(self.rtf, 3), "queue_depth": self.queue_depth}})
+
+    def partial_options(self, greedy_partial=False):
+        options = TIERS[self.tier]["partial"]
+        if options is None and greedy_partial:
+            return GREEDY
+        return options
+
+    def final_options(self):
+        return TIERS[self.tier]["final"]
@@ -0,0 +1,77 @@
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+from config import Config
+
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    结构化日志：消息之外的字段通过 extra={"fields": {...}} 传入，
+    text 格式输出为 key=value，json 格式每行一个 JSON 对象
+    """
+    def __init__(self, log_format="text"):
+        super().__init__()
+        self.log_format = log_format
+
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created))
+
+        if self.log_format == "json":
+            entry = {
+                "time": f"{timestamp}.{int(record.msecs):03d}",
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry["exception"] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        line = f"{timestamp}.{int(record.msecs):03d} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value!r}" if isinstance(value, str) else f"{key}={value}"
+                                   for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把日志记录放入队列，格式化和输出都在后台线程中进行，调用方不做字符串拼接
+    """
+    def prepare(self, record):
+        return record
+
+
+def setup_logging():
+    """
+    配置根日志器，由入口脚本（web_server.py、router.py、bulk_transcribe.py）启动时调用一次；
+    其他模块只使用 logging.getLogger(__name__)，导入时不修改全局日志配置，也不启动后台线程
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_config = Config.logging
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(StructuredFormatter(log_config.get("format")))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(log_config.get("level"))
+    root.addHandler(DeferredQueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    # 退出前输出队列中剩余的日志
+    atexit.register(_listener.stop)
@@ -0,0 +1,212 @@
+import time
+import bisect
+import asyncio
+import threading
+import logging
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的桶上界，单位：秒
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 实时率直方图的桶上界
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+# 音频时长直方图的桶上界，单位：秒
+DURATION_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 15.0, 20.0, 30.0)
+# 批量解码的批次大小和占满比例直方图的桶上界
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32)
+OCCUPANCY_BUCKETS = (0.125, 0.25, 0.5, 0.75, 1.0)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    """
+    进程内指标：直方图、计数器和仪表，以 Prometheus 文本格式输出。
+    记录只做一次二分查找和加法，关闭时直接返回；仪表可以注册为函数，在抓取时才计算
+    """
+    def __init__(self, enable=True, prefix="transcriptor"):
+        self.enable = enable
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.descriptions = {}
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.gauge_funcs = {}
+
+    def describe(self, name, metric_type, help_text, buckets=None):
+        self.descriptions[name] = (metric_type, help_text, buckets)
+
+    def observe(self, name, value, **labels):
+        if not self.enable:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(self.descriptions[name][2] or LATENCY_BUCKETS)
+                self.histograms[key] = histogram
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enable:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enable:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def gauge_func(self, name, func):
+        """
+        抓取时调用 func 取值，适合活跃会话数、积压音频等已有状态，推理路径上没有开销
+        """
+        self.gauge_funcs[name] = func
+
+    def timer(self, name, **labels):
+        if not self.enable:
+            return NULL_TIMER
+        return Timer(self, name, labels)
+
+    def format_labels(self, labels, extra=None):
+        items = list(labels) + ([extra] if extra else [])
+        if not items:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+    def render(self):
+        with self.lock:
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self.histograms.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        for name, func in self.gauge_funcs.items():
+            try:
+                gauges[(name, ())] = func()
+            except Exception as e:
+                logger.warning("Warning reading gauge", extra={"fields": {"gauge": name, "error": e}})
+
+        lines = []
+        for name, (metric_type, help_text, _) in self.descriptions.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+
+            if metric_type == "histogram":
+                for (key_name, labels), (counts, total, count, buckets) in histograms.items():
+                    if key_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(buckets, counts):
+                        cumulative += bucket_count
+                        lines.append(f"{full_name}_bucket{self.format_labels(labels, ('le', bound))} {cumulative}")
+                    lines.append(f"{full_name}_bucket{self.format_labels(labels, ('le', '+Inf'))} {count}")
+                    lines.append(f"{full_name}_sum{self.format_labels(labels)} {total}")
+                    lines.append(f"{full_name}_count{self.format_labels(labels)} {count}")
+            else:
+                values = counters if metric_type == "counter" else gauges
+                for (key_name, labels), value in values.items():
+                    if key_name == name:
+                        lines.append(f"{full_name}{self.format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    async def handle_http(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            # 读完请求头，忽略内容
+            while (await reader.readline()).strip():
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                body = self.render().encode("utf-8")
+                status = "200 OK"
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                body = b"not found\n"
+                status = "404 Not Found"
+                content_type = "text/plain; charset=utf-8"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.warning("Warning serving metrics", extra={"fields": {"error": e}})
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        return await asyncio.start_server(self.handle_http, host, port)
+
+
+metrics = Metrics(enable=Config.metrics.get("enable"))
+
+metrics.describe("stage_seconds", "histogram", "Latency of each pipeline stage in seconds", LATENCY_BUCKETS)
+metrics.describe("rtf", "histogram", "Inference time divided by audio duration per request", RTF_BUCKETS)
+metrics.describe("buffer_seconds", "histogram", "Audio buffer length after each inference in seconds", DURATION_BUCKETS)
+metrics.describe("batch_size", "histogram", "Requests per cross-session batch decode", BATCH_SIZE_BUCKETS)
+metrics.describe("batch_occupancy", "histogram", "Batch size divided by batch_decode.max_batch_size", OCCUPANCY_BUCKETS)
+metrics.describe("audio_seconds_total", "counter", "Audio seconds received for inference")
+metrics.describe("inference_seconds_total", "counter", "Seconds spent in inference")
+metrics.describe("messages_total", "counter", "Websocket messages received by type")
+metrics.describe("received_bytes_total", "counter", "Websocket bytes received")
+metrics.describe("sent_bytes_total", "counter", "Websocket bytes sent")
+metrics.describe("inference_inflight", "gauge", "Inference requests queued or running in the worker pool")
+metrics.describe("active_sessions", "gauge", "Connected websocket sessions")
+metrics.describe("pending_audio_seconds", "gauge", "Audio seconds waiting in session queues")
+metrics.describe("audio_buffer_bytes", "gauge", "Memory preallocated for session audio buffers in bytes")
+metrics.describe("dropped_chunks", "gauge", "Audio chunks dropped by backpressure in connected sessions")
+metrics.describe("ready", "gauge", "1 after all models are loaded and warmed up, 0 while loading")
+metrics.describe("dump_written_total", "counter", "Audio dump files written")
+metrics.describe("dump_dropped_total", "counter", "Audio dump segments dropped because the write queue was full")
+metrics.describe("result_cache_entries", "gauge", "Inference results kept for retransmitted audio and requests")
+metrics.describe("result_cache_hits_total", "counter", "Retransmitted audio frames and requests answered from the result cache")
+metrics.describe("rejected_frames_total", "counter", "Duplicate or out-of-order audio frames rejected without inference")
+metrics.describe("decode_tier", "gauge", "Adaptive decoding tier, 0 is full quality")
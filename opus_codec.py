@@ -0,0 +1,197 @@
+import logging
+import numpy as np
+import opuslib_next
+from opuslib_next.api import c_float_pointer
+from opuslib_next.api.decoder import libopus_decode_float
+
+logger = logging.getLogger(__name__)
+
+# 每个 Opus 包前的长度头，2 字节大端
+LENGTH_HEADER = 2
+
+
+def split_packets(opus_audio):
+    """
+    按长度头切分 Opus 包，返回 memoryview 切片，不复制数据；末尾不完整的包被丢弃
+    """
+    view = memoryview(opus_audio)
+    total = len(view)
+    packets = []
+    offset = 0
+    while offset + LENGTH_HEADER <= total:
+        end = offset + LENGTH_HEADER + ((view[offset] << 8) | view[offset + 1])
+        if end > total:
+            logger.warning("数据不完整，丢弃剩余数据", extra={"fields": {"bytes": total - offset}})
+            break
+        packets.append(view[offset + LENGTH_HEADER:end])
+        offset = end
+    return packets
+
+
+class OpusDecoder:
+    """
+    单路 Opus 流的解码器：解码器带有预测状态，每个会话、每路流使用独立的实例。
+    PCM 直接以 float32 写入预分配的数组，不经过 int16 中转；
+    按协议 2 的帧序号做小的抖动缓冲，丢失的帧用 FEC 和 PLC 补齐，保持音频时长不变
+    """
+    def __init__(self, samplerate=16000, channels=1, frame_size=320, jitter_frames=2, max_conceal_packets=16):
+        self.decoder = opuslib_next.Decoder(samplerate, channels)
+        self.samplerate = samplerate
+        self.channels = channels
+        self.frame_size = frame_size
+        self.jitter_frames = jitter_frames
+        self.max_conceal_packets = max_conceal_packets
+
+        # 解码输出，容量不足时按两倍扩容
+        self.pcm = np.zeros(frame_size * channels * 16, dtype=np.float32)
+
+        # 抖动缓冲：等待输出的帧序号和乱序到达的帧
+        self.next_seq = None
+        self.held = {}
+        # 上一帧的包数，用于估计丢失的帧包含多少个包
+        self.last_packets = 1
+
+        self.lost_frames = 0
+        self.late_frames = 0
+        self.concealed_packets = 0
+
+    def ensure_capacity(self, samples):
+        if len(self.pcm) < samples:
+            self.pcm = np.zeros(max(samples, len(self.pcm) * 2), dtype=np.float32)
+
+    def decode_packet(self, packet, offset, fec=False):
+        """
+        解码一个包写入 self.pcm[offset:]，返回写入的采样点数；packet 为空时按丢包做 PLC
+        """
+        data = bytes(packet)
+        out = self.pcm[offset:].ctypes.data_as(c_float_pointer)
+        result = libopus_decode_float(self.decoder.decoder_state, data, len(data), out, self.frame_size, int(fec))
+        if result < 0:
+            raise opuslib_next.OpusError(result)
+        return result * self.channels
+
+    def decode(self, opus_audio):
+        """
+        解码带长度头的 Opus 包序列，返回 float32 音频；损坏的包用 PLC 补齐
+        """
+        packets = split_packets(opus_audio)
+        self.ensure_capacity(len(packets) * self.frame_size * self.channels)
+
+        offset = 0
+        for packet in packets:
+            try:
+                offset += self.decode_packet(packet, offset)
+            except opuslib_next.OpusError as e:
+                logger.warning("解码失败", extra={"fields": {"bytes": len(packet), "error": e}})
+                offset += self.decode_packet(b"", offset)
+
+        if packets:
+            self.last_packets = len(packets)
+        # 输出交给会话队列，复制一份，预分配的数组留给下一次解码
+        return self.pcm[:offset].copy()
+
+    def conceal(self, lost_frames, next_audio):
+        """
+        补齐丢失的帧：最后一个包用下一帧第一个包携带的 FEC 数据恢复，其余用 PLC
+        """
+        packets = min(lost_frames * self.last_packets, self.max_conceal_packets)
+        self.ensure_capacity(packets * self.frame_size * self.channels)
+        next_packets = split_packets(next_audio)
+
+        offset = 0
+        for i in range(packets):
+            if i == packets - 1 and next_packets:
+                offset += self.decode_packet(next_packets[0], offset, fec=True)
+            else:
+                offset += self.decode_packet(b"", offset)
+
+        self.lost_frames += lost_frames
+        self.concealed_packets += packets
+        return self.pcm[:offset].copy()
+
+    def receive(self, seq, opus_audio):
+        """
+        按序号接收一帧，返回可以按顺序输出的 (序号, 音频) 列表，补齐丢失帧的音频序号为 None。
+        序号不连续时最多缓存 jitter_frames 帧等待缺失的帧，超出后视为丢失并补齐；
+        序号小于已输出的帧（重复或迟到）直接丢弃
+        """
+        if self.next_seq is None:
+            self.next_seq = seq
+        if self.is_duplicate(seq):
+            self.late_frames += 1
+            return []
+
+        self.held[seq] = opus_audio
+        outputs = []
+        while self.held:
+            if self.next_seq in self.held:
+                outputs.append((self.next_seq, self.decode(self.held.pop(self.next_seq))))
+                self.next_seq += 1
+            elif len(self.held) > self.jitter_frames:
+                first_seq = min(self.held)
+                outputs.append((None, self.conceal(first_seq - self.next_seq, self.held[first_seq])))
+                logger.warning("Audio frames lost", extra={"fields": {
+                    "from_seq": self.next_seq, "to_seq": first_seq - 1}})
+                self.next_seq = first_seq
+            else:
+                break
+        return outputs
+
+    def flush(self):
+        """
+        输出抖动缓冲中等待的全部帧，缺失的帧补齐；客户端停止发送时调用，最后几帧不会一直等待
+        """
+        outputs = []
+        while self.held:
+            first_seq = min(self.held)
+            if first_seq > self.next_seq:
+                outputs.append((None, self.conceal(first_seq - self.next_seq, self.held[first_seq])))
+                self.next_seq = first_seq
+            outputs.append((self.next_seq, self.decode(self.held.pop(self.next_seq))))
+            self.next_seq += 1
+        return outputs
+
+    def reset(self):
+        """
+        开始新的一段流：清空抖动缓冲和解码器的预测状态，之后收到的第一帧作为新的起始序号
+        """
+        self.decoder = opuslib_next.Decoder(self.samplerate, self.channels)
+        self.next_seq = None
+        self.held = {}
+        self.last_packets = 1
+
+    def is_duplicate(self, seq):
+        """
+        序号已经输出、判定为丢失或正在抖动缓冲中等待
+        """
+        return self.next_seq is not None and (seq < self.next_seq or seq in self.held)
+
+    def stats(self):
+        return {
+            "lost_frames": self.lost_frames,
+            "late_frames": self.late_frames,
+            "concealed_packets": self.concealed_packets,
+        }
+
+
+class OpusEncoder:
+    """
+    单路 Opus 流的编码器，输出带 2 字节长度头的包序列，不足一帧的尾部被丢弃
+    """
+    def __init__(self, samplerate=16000, channels=1, frame_size=320):
+        self.encoder = opuslib_next.Encoder(samplerate, channels, opuslib_next.APPLICATION_VOIP)
+        self.frame_size = frame_size
+
+    def encode(self, audio_i16):
+        num_frames = len(audio_i16) // self.frame_size
+        if num_frames == 0:
+            logger.debug("数据长度小于一帧，返回空字节串", extra={"fields": {"samples": len(audio_i16)}})
+            return b""
+
+        frames = np.ascontiguousarray(audio_i16, dtype=np.int16)
+        opus_list = []
+        for i in range(num_frames):
+            opus_audio = self.encoder.encode(frames[i * self.frame_size:(i + 1) * self.frame_size].tobytes(), self.frame_size)
+            opus_list.append(len(opus_audio).to_bytes(LENGTH_HEADER, 'big'))
+            opus_list.append(opus_audio)
+        return b"".join(opus_list)
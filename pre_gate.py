@@ -0,0 +1,64 @@
+import threading
+import numpy as np
+
+
+class GateStats:
+    """
+    单个会话的预门限统计，记录跳过了多少音频块和音频时长
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.chunks = 0
+        self.skipped_chunks = 0
+        self.seconds = 0.0
+        self.skipped_seconds = 0.0
+
+    def update(self, duration, skipped):
+        with self.lock:
+            self.chunks += 1
+            self.seconds += duration
+            if skipped:
+                self.skipped_chunks += 1
+                self.skipped_seconds += duration
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "chunks": self.chunks,
+                "skipped_chunks": self.skipped_chunks,
+                "seconds": round(self.seconds, 3),
+                "skipped_seconds": round(self.skipped_seconds, 3),
+                "skipped_ratio": round(self.skipped_seconds / self.seconds, 3) if self.seconds > 0 else 0.0,
+            }
+
+
+class PreGate:
+    """
+    语音增强之前的廉价静音判断：原始音频的 RMS 低于阈值，或 VAD 检测到的语音窗口数不足时，
+    跳过增强、VAD 和转录
+    """
+    def __init__(self, gate_config, vad_engine=None, min_voice_duration=8):
+        self.rms_threshold_dbfs = gate_config.get("rms_threshold_dbfs")
+        self.vad_threshold = gate_config.get("vad_threshold")
+        self.vad_engine = vad_engine if gate_config.get("use_vad") else None
+        self.min_voice_duration = min_voice_duration
+
+    def is_silence(self, audio_np):
+        if len(audio_np) == 0:
+            return True
+
+        rms = np.sqrt(np.mean(np.square(audio_np, dtype=np.float32))) + 1e-10
+        if 20 * np.log10(rms) < self.rms_threshold_dbfs:
+            return True
+
+        if self.vad_engine is not None:
+            scores = self.vad_engine.score(audio_np)
+            voice_windows = np.count_nonzero(scores > self.vad_threshold)
+            # 与 VadEngine.remove_silence 一致，短音频块按窗口数缩小最小语音时长
+            if voice_windows < self.vad_engine.scale_windows(self.min_voice_duration, len(scores)):
+                return True
+
+        return False
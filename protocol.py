@@ -0,0 +1,74 @@
+"""
+协议版本：
+1: 文本 JSON 消息，音频为 Base64 编码的 Opus 数据（旧客户端，默认）
+2: 连接后客户端先发送 hello 协商，音频以二进制帧发送，控制消息仍为文本 JSON，
+   服务端的结果按协商的编码发送：json 为紧凑的文本 JSON，msgpack 为二进制帧
+"""
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PROTOCOL_VERSION = 2
+
+# 二进制帧头：协议版本、帧类型、标志位、序号，共 8 字节，之后为负载
+FRAME_HEADER = struct.Struct(">BBHI")
+FRAME_AUDIO = 1
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+
+def supported_encodings():
+    if msgpack is not None:
+        return [ENCODING_MSGPACK, ENCODING_JSON]
+    return [ENCODING_JSON]
+
+
+def negotiate(hello):
+    """
+    根据客户端的 hello 消息选择协议版本和编码，返回 (版本, 编码)
+    """
+    protocol = min(int(hello.get("protocol", 1)), PROTOCOL_VERSION)
+    if protocol < 2:
+        return 1, ENCODING_JSON
+
+    encodings = supported_encodings()
+    for encoding in hello.get("encodings", [ENCODING_JSON]):
+        if encoding in encodings:
+            return protocol, encoding
+    return protocol, ENCODING_JSON
+
+
+def pack_frame(kind, payload, seq=0, flags=0):
+    return FRAME_HEADER.pack(PROTOCOL_VERSION, kind, flags, seq) + payload
+
+
+def unpack_frame(message):
+    """
+    解析二进制帧，返回 (帧类型, 标志位, 序号, 负载)，负载为 memoryview，不复制数据
+    """
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError(f"frame too short: {len(message)} bytes")
+    version, kind, flags, seq = FRAME_HEADER.unpack_from(message)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"unsupported frame version: {version}")
+    return kind, flags, seq, memoryview(message)[FRAME_HEADER.size:]
+
+
+def encode_message(message, encoding=ENCODING_JSON):
+    """
+    编码服务端消息：json 返回紧凑的文本，msgpack 返回二进制
+    """
+    if encoding == ENCODING_MSGPACK:
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_message(message):
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return msgpack.unpackb(message, raw=False)
+    return json.loads(message)
@@ -1,14 +1,15 @@
 import os
 import soundfile as sf
 import numpy as np
-import librosa
 
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
     from speech_enhance import SpeechEnhance
+    from resampler import resample
 except ImportError:
     from ..speech_enhance import SpeechEnhance
+    from ..resampler import resample
 
 RATE_16K = 16000
 
@@ -35,7 +36,7 @@ if __name__ == "__main__":
 
     # 转换为 16kHz
     if samplerate != RATE_16K:
-        audio_enhanced_16k = librosa.resample(audio_enhanced, orig_sr=samplerate, target_sr=RATE_16K)
+        audio_enhanced_16k = resample(audio_enhanced, samplerate, RATE_16K)
     else:
         audio_enhanced_16k = audio_enhanced
 
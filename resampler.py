@@ -0,0 +1,101 @@
+from math import gcd
+from functools import lru_cache
+import numpy as np
+from scipy.signal import firwin, upfirdn, resample_poly
+
+
+@lru_cache(maxsize=None)
+def polyphase_filter(up, down):
+    """
+    低通滤波器系数，设计与 scipy.signal.resample_poly 默认一致（Kaiser 窗，beta=5），按采样率比缓存
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    h.setflags(write=False)
+    return h
+
+
+def rate_ratio(orig_sr, target_sr):
+    divisor = gcd(int(orig_sr), int(target_sr))
+    return int(target_sr) // divisor, int(orig_sr) // divisor
+
+
+def resample(audio_np, orig_sr, target_sr):
+    """
+    整段音频重采样，替代 librosa.resample，滤波器系数只设计一次
+    """
+    if orig_sr == target_sr:
+        return audio_np
+    up, down = rate_ratio(orig_sr, target_sr)
+    audio_np = np.asarray(audio_np, dtype=np.float32)
+    return resample_poly(audio_np, up, down, window=polyphase_filter(up, down)).astype(np.float32, copy=False)
+
+
+class StreamResampler:
+    """
+    流式多相重采样：保留上一块的输入尾部，连续的音频块拼接后与整段重采样结果一致，块边界没有瞬态。
+    输出比输入延迟滤波器长度的一半。
+    """
+    def __init__(self, orig_sr, target_sr):
+        self.up, self.down = rate_ratio(orig_sr, target_sr)
+        if self.up == self.down:
+            self.filter = np.ones(1, dtype=np.float32)
+        else:
+            self.filter = (polyphase_filter(self.up, self.down) * self.up).astype(np.float32)
+        # 滤波器群延迟（上采样后的采样点），输出 n 对应上采样后位置 n * down + delay
+        self.delay = (len(self.filter) - 1) // 2
+        # 每个输出需要的输入采样点数，多保留 down 个用于对齐相位
+        self.history_size = -(-len(self.filter) // self.up) + self.down
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        # 起始之前视为静音
+        self.history = np.zeros(self.history_size, dtype=np.float32)
+        self.input_pos = 0
+        self.output_pos = 0
+
+    def process(self, audio_np):
+        audio_np = np.asarray(audio_np, dtype=np.float32)
+        if self.up == self.down:
+            return audio_np
+
+        history_len = len(self.history)
+        total = history_len + len(audio_np)
+        if len(self.buffer) < total:
+            self.buffer = np.empty(total * 2, dtype=np.float32)
+        buffer = self.buffer[:total]
+        buffer[:history_len] = self.history
+        buffer[history_len:] = audio_np
+
+        end = self.input_pos + len(audio_np)
+        # 可以计算的最后一个输出：所需的最后一个输入采样点不超过 end - 1
+        last_output = (end * self.up - 1 - self.delay) // self.down
+        count = last_output - self.output_pos + 1
+
+        output = np.zeros(0, dtype=np.float32)
+        if count > 0:
+            # 选择起点使 upfirdn 的输出位置与全局输出位置对齐
+            start = self.input_pos - history_len
+            while (self.delay - start * self.up) % self.down != 0:
+                start += 1
+            first = (self.output_pos * self.down + self.delay - start * self.up) // self.down
+            offset = start - (self.input_pos - history_len)
+            filtered = upfirdn(self.filter, buffer[offset:], self.up, self.down)
+            output = filtered[first:first + count].astype(np.float32, copy=False)
+            self.output_pos += count
+
+        self.input_pos = end
+        self.history = buffer[-self.history_size:].copy()
+        return output
+
+    def flush(self):
+        """
+        补零输出剩余的采样点，用于音频结束时，之后需要 reset 才能继续使用
+        """
+        remaining = -(-(self.input_pos * self.up) // self.down) - self.output_pos
+        if remaining <= 0 or self.up == self.down:
+            return np.zeros(0, dtype=np.float32)
+        padding = np.zeros(self.delay // self.up + 2, dtype=np.float32)
+        return self.process(padding)[:remaining]
@@ -0,0 +1,45 @@
+import hashlib
+from collections import OrderedDict
+
+
+def payload_hash(payload):
+    """
+    音频负载或请求原文的短哈希，与序号一起识别重传的消息
+    """
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=8).digest()
+
+
+class ResultCache:
+    """
+    最近的推理结果，键为 (会话, 序号, 哈希)，容量满时淘汰最久未使用的结果。
+    客户端重传或重复发送的音频直接返回缓存的结果，不再做一次增强和转录。
+    只在事件循环线程中访问，不加锁
+    """
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return result
+
+    def put(self, key, result):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def drop(self, client_id):
+        """
+        删除一个客户端的全部结果，会话重置后客户端可能从头编号并发送相同的音频（如静音帧）
+        """
+        for key in [key for key in self.entries if key[0] == client_id]:
+            del self.entries[key]
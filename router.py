@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import logging
+import websockets
+
+from config import Config
+from metrics import Metrics
+from logger import setup_logging
+
+# 作为脚本运行时 __name__ 为 __main__，日志名固定为 router
+logger = logging.getLogger("router")
+
+# 与 web_server.FORWARDED_HEADER 一致，router 不导入 web_server，避免加载模型依赖
+FORWARDED_HEADER = "X-Forwarded-For"
+WEB_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web_server.py")
+
+router_metrics = Metrics(enable=Config.metrics.get("enable"), prefix="router")
+router_metrics.describe("worker_up", "gauge", "1 when the worker process is running and passes health checks")
+router_metrics.describe("worker_ready", "gauge", "1 when the worker has loaded its models")
+router_metrics.describe("worker_sessions", "gauge", "Client sessions routed to the worker")
+router_metrics.describe("worker_load", "gauge", "Load score used to pick a worker for new sessions")
+router_metrics.describe("worker_restarts_total", "counter", "Worker process restarts")
+router_metrics.describe("rejected_sessions_total", "counter", "Client sessions rejected because no worker was available")
+
+
+def parse_cpus(cpus):
+    """
+    解析 CPU 核列表，如 "0-7,16-23"
+    """
+    if not cpus:
+        return None
+    result = set()
+    for part in str(cpus).split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            result.update(range(int(first), int(last) + 1))
+        else:
+            result.add(int(part))
+    return result
+
+
+class Worker:
+    """
+    一个 web_server.py 子进程：监听 unix socket，加载一份模型，绑定到指定的 GPU 和 CPU 核
+    """
+    def __init__(self, index, worker_config, router_config):
+        self.index = index
+        self.label = str(index)
+        self.gpu = worker_config.get("gpu")
+        self.cpus = parse_cpus(worker_config.get("cpus"))
+        self.socket_path = os.path.join(router_config.get("socket_dir"), f"worker{index}.sock")
+        self.metrics_port = router_config.get("metrics_port_base") + index
+
+        self.process = None
+        self.started_at = 0.0
+        self.exited_at = None
+        self.restarts = 0
+
+        # 最近一次健康检查的结果，sessions 为 router 转发给该 worker 的连接数，实时维护
+        self.health = None
+        self.failures = 0
+        self.sessions = 0
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def healthy(self):
+        return self.alive and self.health is not None
+
+    @property
+    def ready(self):
+        return self.healthy and self.health.get("status") == "ready"
+
+    def load(self):
+        """
+        负载 = 转发的会话数 + 推理队列深度 + 积压音频秒数，健康检查之间新分配的会话立即计入
+        """
+        health = self.health or {}
+        return self.sessions + health.get("inflight", 0) + health.get("pending_audio_seconds", 0.0)
+
+    async def start(self):
+        env = dict(os.environ)
+        if self.gpu is not None:
+            env["CUDA_VISIBLE_DEVICES"] = str(self.gpu)
+        preexec_fn = None
+        if self.cpus:
+            # 在子进程 exec 之前绑定 CPU 核，之后创建的所有线程都继承绑定，线程池大小与核数一致
+            cpus = self.cpus
+            env["OMP_NUM_THREADS"] = str(len(cpus))
+            preexec_fn = lambda: os.sched_setaffinity(0, cpus)
+
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, WEB_SERVER, "--socket", self.socket_path, "--metrics-port", str(self.metrics_port),
+            env=env, preexec_fn=preexec_fn,
+        )
+        self.started_at = time.monotonic()
+        self.exited_at = None
+        self.health = None
+        self.failures = 0
+        logger.info("Worker started", extra={"fields": {
+            "worker": self.index, "pid": self.process.pid, "gpu": self.gpu, "socket": self.socket_path}})
+
+    async def stop(self, timeout=10.0):
+        if not self.alive:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+    async def check_health(self, timeout):
+        """
+        通过 unix socket 请求 GET /health，返回 web_server 的负载和就绪状态
+        """
+        reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(self.socket_path), timeout)
+        try:
+            writer.write(b"GET /health HTTP/1.1\r\nHost: worker\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout)
+        finally:
+            writer.close()
+
+        header, _, body = response.partition(b"\r\n\r\n")
+        if not header.startswith(b"HTTP/1.1 200"):
+            raise ConnectionError(header.split(b"\r\n", 1)[0].decode("latin-1"))
+        return json.loads(body)
+
+
+class Router:
+    """
+    前端进程：在 6002 端口接受 websocket 连接，每个连接固定转发给一个 worker 进程。
+    转发的是原始 websocket 消息（Opus 音频帧和控制消息），会话状态和 Opus 编解码器都在 worker 中，
+    router 不解码音频，也不序列化数组。新连接分配给就绪且负载最低的 worker，
+    worker 退出或健康检查连续失败时自动重启，该 worker 上的连接被关闭，由客户端重连
+    """
+    def __init__(self, router_config):
+        self.config = router_config
+        os.makedirs(router_config.get("socket_dir"), exist_ok=True)
+        self.workers = [
+            Worker(index, worker_config, router_config)
+            for index, worker_config in enumerate(router_config.get("workers"))
+        ]
+
+    def pick_worker(self):
+        """
+        优先选择已就绪的 worker，都在加载模型时选择健康的 worker，音频在 worker 的会话队列中等待
+        """
+        for candidates in ([w for w in self.workers if w.ready], [w for w in self.workers if w.healthy]):
+            if candidates:
+                return min(candidates, key=Worker.load)
+        return None
+
+    async def monitor_worker(self, worker):
+        if not worker.alive:
+            if worker.process is not None and worker.exited_at is None:
+                worker.exited_at = time.monotonic()
+                worker.health = None
+                logger.error("Worker exited", extra={"fields": {
+                    "worker": worker.index, "returncode": worker.process.returncode}})
+            if worker.exited_at is None or time.monotonic() - worker.exited_at >= self.config.get("restart_delay"):
+                if worker.process is not None:
+                    worker.restarts += 1
+                    router_metrics.inc("worker_restarts_total", worker=worker.label)
+                await worker.start()
+            return
+
+        try:
+            worker.health = await worker.check_health(self.config.get("health_timeout"))
+            worker.failures = 0
+        except Exception as e:
+            worker.health = None
+            if time.monotonic() - worker.started_at < self.config.get("startup_timeout"):
+                # 启动阶段 worker 还在导入依赖，socket 尚未创建
+                return
+            worker.failures += 1
+            logger.warning("Worker health check failed", extra={"fields": {"error": e,
+                "worker": worker.index, "failures": worker.failures}})
+            if worker.failures >= self.config.get("max_failures"):
+                # 进程仍在但不响应，结束后由下一次检查重启
+                logger.error("Worker unresponsive, kill", extra={"fields": {"worker": worker.index}})
+                worker.process.kill()
+
+    async def monitor(self):
+        while True:
+            await asyncio.gather(*(self.monitor_worker(worker) for worker in self.workers))
+            for worker in self.workers:
+                router_metrics.set("worker_up", int(worker.healthy), worker=worker.label)
+                router_metrics.set("worker_ready", int(worker.ready), worker=worker.label)
+                router_metrics.set("worker_sessions", worker.sessions, worker=worker.label)
+                router_metrics.set("worker_load", round(worker.load(), 3), worker=worker.label)
+            await asyncio.sleep(self.config.get("health_interval"))
+
+    async def pipe(self, source, target):
+        try:
+            async for message in source:
+                await target.send(message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def handle_client(self, websocket):
+        client_address = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
+        worker = self.pick_worker()
+        if worker is None:
+            router_metrics.inc("rejected_sessions_total")
+            logger.warning("No worker available", extra={"fields": {"session": client_address}})
+            await websocket.close(1013, "no worker available")
+            return
+
+        worker.sessions += 1
+        logger.info("Route session", extra={"fields": {"session": client_address, "worker": worker.index}})
+        try:
+            async with websockets.unix_connect(
+                    worker.socket_path,
+                    additional_headers={FORWARDED_HEADER: client_address},
+                    max_size=10*1024*1024,
+                    compression=None,       # 本机转发，不压缩
+                    ping_interval=None) as upstream:
+                tasks = [
+                    asyncio.create_task(self.pipe(websocket, upstream)),
+                    asyncio.create_task(self.pipe(upstream, websocket)),
+                ]
+                # 任一方向结束（客户端断开或 worker 退出）即结束转发
+                _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in pending:
+                    task.cancel()
+                if upstream.close_code is not None and websocket.close_code is None:
+                    await websocket.close(1012, "worker restarting")
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            logger.warning("Route error", extra={"fields": {"session": client_address, "worker": worker.index, "error": e}})
+            await websocket.close(1011, "worker unavailable")
+        finally:
+            worker.sessions -= 1
+
+    async def start(self, host="0.0.0.0", port=6002, metrics_port=None):
+        main_task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, main_task.cancel)
+
+        if router_metrics.enable and metrics_port:
+            self.metrics_server = await router_metrics.serve('0.0.0.0', metrics_port)
+            logger.info("Router metrics started", extra={"fields": {"url": f"http://0.0.0.0:{metrics_port}/metrics"}})
+
+        monitor_task = asyncio.create_task(self.monitor())
+        try:
+            async with websockets.serve(self.handle_client, host, port,
+                                        max_size=10*1024*1024,
+                                        ping_interval=20,
+                                        ping_timeout=20):
+                logger.info("Router started", extra={"fields": {"url": f"ws://{host}:{port}", "workers": len(self.workers)}})
+                await asyncio.Future()
+        except asyncio.CancelledError:
+            logger.info("Router stopping")
+        finally:
+            monitor_task.cancel()
+            await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="多进程部署：按会话把连接转发给多个转录 worker 进程")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=6002, help="websocket 端口")
+    parser.add_argument("--metrics-port", type=int, default=Config.metrics.get("port"), help="router 运行指标端口")
+    args = parser.parse_args()
+
+    router = Router(Config.router)
+    asyncio.run(router.start(args.host, args.port, args.metrics_port))
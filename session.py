@@ -0,0 +1,195 @@
+import asyncio
+import logging
+from collections import deque
+import numpy as np
+
+from streaming import StreamingState
+from speaker_cluster import SpeakerClusters
+from speech_enhance import EnhanceState
+from pre_gate import GateStats
+from vad_engine import SilenceTracker
+from opus_codec import OpusDecoder, OpusEncoder
+from audio_buffer import AudioRingBuffer
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    单个 websocket 连接的转录状态，保存在服务端，客户端只需要发送新的音频。
+    """
+    def __init__(self, session_id, samplerate=16000, max_pending_duration=5, cluster_config=None, loudness_window=10,
+                 opus_config=None, interruption_duration=20):
+        self.session_id = session_id
+        # 缓存推理结果时的会话编号，客户端在 hello 中提供 client_id 时改用它，重连后重传的音频仍能命中缓存
+        self.client_id = session_id
+        self.samplerate = samplerate
+        self.max_pending_samples = int(max_pending_duration * samplerate)
+
+        # 待推理的音频块 (音频, 序号, 哈希)，按到达顺序排列，序号和哈希用于缓存推理结果
+        self.pending = deque()
+        self.pending_samples = 0
+        self.pending_event = asyncio.Event()
+        self.dropped_chunks = 0
+        # 已到达但还在抖动缓冲中的帧的哈希，和正在推理的帧 [(序号, 哈希)]
+        self.frame_hashes = {}
+        self.inflight_frames = []
+        # 抖动缓冲等待超时后输出剩余帧的定时器
+        self.flush_handle = None
+
+        # 未结束句子的音频缓冲区，超过 interruption_duration 时句子被强制结束，
+        # 容量再加上一次合并推理的积压音频和句子中的短停顿，每个会话的内存固定
+        self.audio_buffer = AudioRingBuffer((interruption_duration + max_pending_duration + 2) * samplerate, samplerate)
+
+        # 流式解码状态，只在 Config.streaming_decode 开启时使用
+        self.stream_state = StreamingState(samplerate)
+        # 流式语音增强状态，只在 Config.speech_enhance["streaming"] 开启时使用
+        self.enhance_state = EnhanceState(samplerate, loudness_window)
+        # 预门限跳过的音频统计
+        self.gate_stats = GateStats()
+        # 连续静音时长，客户端发送小于 1 秒的音频块时累计判断句子结束
+        self.silence_tracker = SilenceTracker()
+        # 未注册说话人的在线聚类，cluster_config 为 None 时未注册说话人统一为 guest
+        self.speaker_clusters = SpeakerClusters(cluster_config) if cluster_config else None
+
+        # 每个连接独立的 Opus 编解码器，编解码器带有预测状态，不能在连接之间共享；
+        # 旧协议回传的音频缓冲区是另一路流，使用单独的编码器和解码器
+        opus_config = opus_config or {}
+        frame_size = opus_config.get("frame_size", 320)
+        self.audio_decoder = OpusDecoder(
+            samplerate,
+            frame_size=frame_size,
+            jitter_frames=opus_config.get("jitter_frames", 2),
+            max_conceal_packets=opus_config.get("max_conceal_packets", 16),
+        )
+        self.buffer_encoder = OpusEncoder(samplerate, frame_size=frame_size)
+        self.buffer_decoder = OpusDecoder(samplerate, frame_size=frame_size)
+
+        # 连接协商的协议版本和结果编码，旧客户端不发送 hello，使用协议 1
+        self.protocol = 1
+        self.encoding = "json"
+
+        # 完整句子编号，异步识别说话人时 speaker_update 消息通过编号对应句子
+        self.sentence_id = 0
+        # 异步识别说话人时，本次推理产生的完整句子音频，等待提交给说话人识别线程
+        self.pending_speaker_audio = None
+
+        # reset 消息到达时先丢弃积压的音频并递增 generation，由 process_session 在两次推理之间执行重置，
+        # 推理期间收到 reset 时，该次推理属于旧的 generation，结果被丢弃
+        self.generation = 0
+        self.reset_requests = []
+
+        self.reset()
+
+    def current_speaker(self):
+        """
+        最近一句的说话人：异步识别已经完成时为识别结果，否则为 last_speaker（可能是临时标签）
+        """
+        resolved = self.resolved_speaker
+        if resolved is not None and resolved[0] == self.sentence_id:
+            return resolved[1]
+        return self.last_speaker
+
+    def reset(self):
+        """
+        创建会话时调用，之后只由 process_session 在两次推理之间调用，与推理线程中的 inference 和 update 不会同时修改音频缓冲区
+        """
+        self.last_speaker = "guest"
+        # 异步识别出的最近一句的说话人 (句子编号, 说话人)，只在事件循环中写入
+        self.resolved_speaker = None
+        self.last_sentence = ""
+        self.last_transcript = ""
+        self.audio_buffer.clear()
+        self.stream_state.reset()
+        self.enhance_state.reset()
+        self.silence_tracker.reset()
+        if self.speaker_clusters is not None:
+            self.speaker_clusters.reset()
+
+    def stats(self):
+        return {
+            "session": self.session_id,
+            "dropped_chunks": self.dropped_chunks,
+            "audio_buffer": self.audio_buffer.stats(),
+            "opus": self.audio_decoder.stats(),
+            "pre_gate": self.gate_stats.to_dict(),
+        }
+
+    def next_sentence_id(self):
+        self.sentence_id += 1
+        return self.sentence_id
+
+    def update(self, speaker, sentence, transcript, new_buffer):
+        """
+        在推理线程中调用，推理期间收到的 reset 在之后执行
+        """
+        self.last_speaker = speaker
+        self.last_sentence = sentence
+        self.last_transcript = transcript
+        self.audio_buffer.assign(new_buffer)
+
+    @property
+    def last_buffer(self):
+        return self.audio_buffer.view()
+
+    def push_audio(self, audio_data, seq=None, audio_hash=None):
+        """
+        加入新的音频块，积压超过 max_pending_duration 时丢弃最早的音频块
+        """
+        self.pending.append((audio_data, seq, audio_hash))
+        self.pending_samples += len(audio_data)
+
+        while self.pending_samples > self.max_pending_samples and len(self.pending) > 1:
+            dropped, _, _ = self.pending.popleft()
+            self.pending_samples -= len(dropped)
+            self.dropped_chunks += 1
+            logger.warning("Session falls behind, drop audio", extra={"fields": {
+                "session": self.session_id, "samples": len(dropped)}})
+
+        self.pending_event.set()
+
+    def request_reset(self, request):
+        """
+        在事件循环线程中调用，重置本身由 process_session 执行，不与推理线程同时修改会话状态
+        """
+        self.pending.clear()
+        self.pending_samples = 0
+        # 抖动缓冲只在事件循环中访问，在这里而不是在 reset 中清空：reset 执行前到达的帧已经属于新的一段流，
+        # 重置前等待的乱序帧不会混入新的句子，客户端也可以从新的序号开始发送
+        self.cancel_flush()
+        self.audio_decoder.reset()
+        self.frame_hashes.clear()
+        self.generation += 1
+        self.reset_requests.append(request)
+        self.pending_event.set()
+
+    def cancel_flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+    def pop_audio(self):
+        """
+        取出所有积压的音频块并合并为一块，推理落后时多个音频块合并为一次推理，
+        合并的帧记录在 inflight_frames 中，推理结果按这些帧缓存
+        """
+        if len(self.pending) == 0:
+            return None
+
+        if len(self.pending) == 1:
+            audio_data = self.pending[0][0]
+        else:
+            audio_data = np.concatenate([audio for audio, _, _ in self.pending])
+        self.inflight_frames = [(seq, audio_hash) for _, seq, audio_hash in self.pending if seq is not None]
+        self.pending.clear()
+        self.pending_samples = 0
+
+        return audio_data
+
+    def has_frame(self, seq):
+        """
+        序号对应的帧在抖动缓冲、积压队列中或正在推理，结果稍后发送
+        """
+        return (seq in self.frame_hashes
+                or any(seq == frame_seq for frame_seq, _ in self.inflight_frames)
+                or any(seq == frame_seq for _, frame_seq, _ in self.pending))
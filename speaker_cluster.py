@@ -0,0 +1,154 @@
+import threading
+import logging
+from collections import deque
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SpeakerClusters:
+    """
+    会话内的在线说话人聚类：未注册的说话人按句子 embedding 归入最相似的聚类中心，
+    没有足够相似的聚类时新建 guest_N。每句只与 k 个聚类中心比较一次，不需要重新聚类历史数据。
+    """
+    def __init__(self, cluster_config):
+        self.assign_threshold = cluster_config.get("assign_threshold")
+        self.merge_threshold = cluster_config.get("merge_threshold")
+        self.split_threshold = cluster_config.get("split_threshold")
+        self.max_members = cluster_config.get("max_members")
+        self.min_split_members = cluster_config.get("min_split_members")
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.labels = []
+        # 每个聚类的 embedding 之和与数量，中心为归一化后的 sums
+        self.sums = None
+        self.counts = []
+        # 每个聚类最近的 embedding，用于拆分
+        self.members = []
+        self.next_guest = 1
+
+    def centroids(self):
+        return self.sums / (np.linalg.norm(self.sums, axis=1, keepdims=True) + 1e-10)
+
+    def new_label(self):
+        label = f"guest_{self.next_guest}"
+        self.next_guest += 1
+        return label
+
+    def add_cluster(self, label, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        cluster_sum = embeddings.sum(axis=0, keepdims=True)
+        if self.sums is None:
+            self.sums = cluster_sum
+        else:
+            self.sums = np.concatenate([self.sums, cluster_sum])
+        self.labels.append(label)
+        self.counts.append(len(embeddings))
+        self.members.append(deque(embeddings, maxlen=self.max_members))
+
+    def remove_cluster(self, index):
+        self.sums = np.delete(self.sums, index, axis=0)
+        del self.labels[index]
+        del self.counts[index]
+        del self.members[index]
+        if len(self.labels) == 0:
+            self.sums = None
+
+    def assign(self, embedding):
+        """
+        把一句话的 embedding 归入聚类，返回聚类标签
+        """
+        with self.lock:
+            if self.sums is None:
+                label = self.new_label()
+                self.add_cluster(label, [embedding])
+                return label
+
+            scores = self.centroids() @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.assign_threshold:
+                label = self.new_label()
+                self.add_cluster(label, [embedding])
+                return label
+
+            self.sums[best] += embedding
+            self.counts[best] += 1
+            self.members[best].append(embedding)
+
+            best = self.merge(best)
+            self.split(best, embedding)
+            return self.labels[best]
+
+    def merge(self, index):
+        """
+        聚类中心更新后如果和其他聚类足够接近则合并，保留数量较多的聚类标签
+        """
+        centroids = self.centroids()
+        scores = centroids @ centroids[index]
+        scores[index] = -np.inf
+        other = int(np.argmax(scores))
+        if scores[other] < self.merge_threshold:
+            return index
+
+        keep, drop = (index, other) if self.counts[index] >= self.counts[other] else (other, index)
+        self.sums[keep] += self.sums[drop]
+        self.counts[keep] += self.counts[drop]
+        self.members[keep].extend(self.members[drop])
+        logger.info("Merge speaker cluster", extra={"fields": {"from": self.labels[drop], "into": self.labels[keep]}})
+        self.remove_cluster(drop)
+        return keep if keep < drop else keep - 1
+
+    def split(self, index, latest):
+        """
+        对聚类最近的成员做一次 2-means，两组中心差异足够大时拆分为两个聚类，
+        最新一句所在的组保留原标签
+        """
+        members = np.stack(self.members[index])
+        if len(members) < self.min_split_members:
+            return
+
+        # 以离中心最远的成员和离它最远的成员作为初始中心
+        centroid = self.centroids()[index]
+        first = members[int(np.argmin(members @ centroid))]
+        second = members[int(np.argmin(members @ first))]
+        centers = np.stack([first, second])
+        for _ in range(5):
+            groups = np.argmax(members @ centers.T, axis=1)
+            if np.all(groups == groups[0]):
+                return
+            centers = np.stack([members[groups == g].mean(axis=0) for g in range(2)])
+            centers /= np.linalg.norm(centers, axis=1, keepdims=True) + 1e-10
+
+        sizes = np.bincount(groups, minlength=2)
+        if sizes.min() < self.min_split_members // 2 or float(centers[0] @ centers[1]) >= self.split_threshold:
+            return
+
+        latest_group = int(np.argmax(centers @ latest))
+        keep_members = members[groups == latest_group]
+        split_members = members[groups != latest_group]
+
+        label = self.labels[index]
+        self.sums[index] = keep_members.sum(axis=0)
+        self.counts[index] = len(keep_members)
+        self.members[index] = deque(keep_members, maxlen=self.max_members)
+
+        new_label = self.new_label()
+        self.add_cluster(new_label, split_members)
+        logger.info("Split speaker cluster", extra={"fields": {"label": label, "new_label": new_label}})
+
+    def promote(self, label, speaker_id):
+        """
+        把聚类提升为命名的说话人，返回聚类中心用于注册，标签不存在时返回 None
+        """
+        with self.lock:
+            if label not in self.labels:
+                return None
+            index = self.labels.index(label)
+            self.labels[index] = speaker_id
+            return self.centroids()[index]
+
+    def list(self):
+        with self.lock:
+            return {label: count for label, count in zip(self.labels, self.counts)}
@@ -0,0 +1,156 @@
+import os
+import json
+import threading
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+SPEAKERS_FILE = "speakers.json"
+
+
+class SpeakerIndex:
+    """
+    说话人 embedding 索引：每行一个归一化后的 embedding，一个说话人可以有多行。
+    持久化为 embeddings.npy 矩阵和 speakers.json 行信息，启动时以内存映射方式加载。
+    """
+    def __init__(self, index_dir=None, aggregate="max"):
+        self.index_dir = index_dir
+        self.aggregate = aggregate
+        self.lock = threading.Lock()
+
+        # 每行的说话人 id 和音频哈希
+        self.rows = []
+        self.embeddings = None
+        self.load()
+
+    def load(self):
+        if self.index_dir is None:
+            self.rebuild([], None)
+            return
+
+        embeddings_path = os.path.join(self.index_dir, EMBEDDINGS_FILE)
+        speakers_path = os.path.join(self.index_dir, SPEAKERS_FILE)
+        if not os.path.exists(embeddings_path) or not os.path.exists(speakers_path):
+            self.rebuild([], None)
+            return
+
+        with open(speakers_path, "r", encoding="utf-8") as f:
+            rows = json.load(f)["rows"]
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+
+        if len(rows) != len(embeddings):
+            logger.warning("Speaker index is broken, ignore it", extra={"fields": {
+                "rows": len(rows), "embeddings": len(embeddings), "index_dir": self.index_dir}})
+            self.rebuild([], None)
+            return
+
+        self.rebuild(rows, embeddings)
+        logger.info("Load speaker index", extra={"fields": {
+            "speakers": len(self.speaker_ids), "embeddings": len(rows)}})
+
+    def save(self):
+        if self.index_dir is None:
+            return
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        embeddings_path = os.path.join(self.index_dir, EMBEDDINGS_FILE)
+        speakers_path = os.path.join(self.index_dir, SPEAKERS_FILE)
+
+        # 先写临时文件再替换，避免写入中途退出导致索引损坏
+        with open(embeddings_path + ".tmp", "wb") as f:
+            if self.embeddings is None:
+                np.save(f, np.zeros((0, 0), dtype=np.float32))
+            else:
+                np.save(f, np.asarray(self.embeddings))
+        with open(speakers_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"rows": self.rows}, f, ensure_ascii=False, indent=4)
+
+        os.replace(embeddings_path + ".tmp", embeddings_path)
+        os.replace(speakers_path + ".tmp", speakers_path)
+
+    def rebuild(self, rows, embeddings):
+        """
+        重建查询用的辅助结构，只在增删时调用，查询时不需要再分组
+        """
+        self.rows = rows
+        self.embeddings = embeddings if embeddings is not None and len(rows) > 0 else None
+
+        self.speaker_ids = []
+        speaker_rows = []
+        positions = {}
+        for row in rows:
+            if row["id"] not in positions:
+                positions[row["id"]] = len(self.speaker_ids)
+                self.speaker_ids.append(row["id"])
+            speaker_rows.append(positions[row["id"]])
+        self.speaker_rows = np.array(speaker_rows, dtype=np.int64)
+
+        # 每个说话人的 embedding 中心，归一化后用于 centroid 模式
+        if self.embeddings is not None:
+            centroids = np.zeros((len(self.speaker_ids), self.embeddings.shape[1]), dtype=np.float32)
+            np.add.at(centroids, self.speaker_rows, self.embeddings)
+            self.centroids = centroids / (np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-10)
+        else:
+            self.centroids = None
+
+    def contains(self, speaker_id, audio_hash):
+        with self.lock:
+            return any(row["id"] == speaker_id and row["hash"] == audio_hash for row in self.rows)
+
+    def add(self, speaker_id, embedding, audio_hash=None):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+
+        with self.lock:
+            rows = self.rows + [{"id": speaker_id, "hash": audio_hash}]
+            if self.embeddings is None:
+                embeddings = embedding
+            else:
+                embeddings = np.concatenate([self.embeddings, embedding])
+            self.rebuild(rows, embeddings)
+            self.save()
+
+    def remove(self, speaker_id):
+        with self.lock:
+            keep = [i for i, row in enumerate(self.rows) if row["id"] != speaker_id]
+            if len(keep) == len(self.rows):
+                return False
+
+            rows = [self.rows[i] for i in keep]
+            embeddings = np.asarray(self.embeddings)[keep] if len(keep) > 0 else None
+            self.rebuild(rows, embeddings)
+            self.save()
+            return True
+
+    def list(self):
+        with self.lock:
+            counts = np.bincount(self.speaker_rows, minlength=len(self.speaker_ids))
+            return {speaker_id: int(count) for speaker_id, count in zip(self.speaker_ids, counts)}
+
+    def __len__(self):
+        return len(self.speaker_ids)
+
+    def search(self, embedding):
+        """
+        返回最相似的说话人 id 和相似度，max 模式取该说话人所有 embedding 中的最大值，
+        centroid 模式与该说话人 embedding 中心比较
+        """
+        with self.lock:
+            speaker_ids = self.speaker_ids
+            embeddings = self.embeddings
+            speaker_rows = self.speaker_rows
+            centroids = self.centroids
+
+        if embeddings is None:
+            return None, -1.0
+
+        if self.aggregate == "centroid":
+            speaker_scores = centroids @ embedding
+        else:
+            row_scores = embeddings @ embedding
+            speaker_scores = np.full(len(speaker_ids), -np.inf, dtype=np.float32)
+            np.maximum.at(speaker_scores, speaker_rows, row_scores)
+
+        best = int(np.argmax(speaker_scores))
+        return speaker_ids[best], float(speaker_scores[best])
@@ -1,44 +1,111 @@
-from modelscope.pipelines import pipeline
+import hashlib
+import threading
+import numpy as np
 
 from config import Config
+from speaker_index import SpeakerIndex
+
+# modelscope 导入耗时较长，创建 SpeakerVerifier 时才导入，可与其他模型的加载并行
+pipeline = None
 
 
 class SpeakerVerifier:
     def __init__(self):
+        global pipeline
+        if pipeline is None:
+            from modelscope.pipelines import pipeline
+
         sv_config = Config.models['speaker_verifier']
         self.sv_pipeline = pipeline(task='speaker-verification', model=sv_config['path'])
+        self.lock = threading.Lock()
 
-        self.registered_speaker = {}
+        # 注册说话人的 embedding 索引，index_dir 为 None 时只保存在内存中
+        self.model_name = sv_config['name']
+        self.match_threshold = sv_config.get('match_threshold', 0.3)
+        self.speaker_index = SpeakerIndex(
+            index_dir=sv_config.get('index_dir'),
+            aggregate=sv_config.get('aggregate', "max"),
+        )
+
+        # 配置文件中的注册说话人，已在索引中的音频不会重复计算
         for speaker in sv_config['speakers']:
             self.register_speaker(speaker['id'], speaker['path'])
 
     def compare(self, audio1, audio2, thr=0.5):
-        return self.sv_pipeline([audio1, audio2], thr=thr)
+        with self.lock:
+            return self.sv_pipeline([audio1, audio2], thr=thr)
 
     def verify(self, audio1, audio2, thr=0.5):
         result = self.compare(audio1, audio2, thr=0.5)
         return result >= thr
 
+    def embed(self, audio):
+        """
+        提取说话人 embedding 并做 L2 归一化，audio 可以是音频路径或 16kHz float32 数组
+        """
+        with self.lock:
+            result = self.sv_pipeline([audio], output_emb=True)
+        embedding = np.asarray(result['embs'], dtype=np.float32).reshape(-1)
+        return embedding / (np.linalg.norm(embedding) + 1e-10)
+
+    def audio_hash(self, audio):
+        hasher = hashlib.sha256(self.model_name.encode("utf-8"))
+        if isinstance(audio, str):
+            with open(audio, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    hasher.update(block)
+        else:
+            hasher.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+        return hasher.hexdigest()
+
     def register_speaker(self, speaker_id, audio):
-        self.registered_speaker[speaker_id] = audio
+        """
+        注册说话人，同一说话人可以注册多段音频，同一段音频不会重复注册
+        """
+        audio_hash = self.audio_hash(audio)
+        if self.speaker_index.contains(speaker_id, audio_hash):
+            return False
+
+        self.speaker_index.add(speaker_id, self.embed(audio), audio_hash)
+        return True
 
-    def match_speaker(self, audio, thr=0.3):
-        if len(self.registered_speaker) == 0:
+    def remove_speaker(self, speaker_id):
+        return self.speaker_index.remove(speaker_id)
+
+    def list_speakers(self):
+        return self.speaker_index.list()
+
+    def enroll_embedding(self, speaker_id, embedding):
+        """
+        直接注册 embedding，例如把会话中的聚类中心提升为命名说话人
+        """
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self.speaker_index.add(speaker_id, embedding / (np.linalg.norm(embedding) + 1e-10))
+
+    def match_speaker(self, audio, thr=None, clusters=None):
+        """
+        匹配注册说话人，没有匹配时如果传入会话聚类 clusters 则返回 guest_N，否则返回 guest；
+        thr 为 None 时使用配置的 match_threshold
+        """
+        if thr is None:
+            thr = self.match_threshold
+
+        if len(self.speaker_index) == 0 and clusters is None:
             return "guest"
 
-        match_scores = {}
-        for speaker_id, registered_audio in self.registered_speaker.items():
-            similarity = self.compare(audio, registered_audio, thr=thr)
-            # print(similarity)
-            match_scores[speaker_id] = similarity['score']
+        # 只提取一次待识别音频的 embedding，与所有注册说话人一次性计算余弦相似度
+        embedding = self.embed(audio)
+
+        if len(self.speaker_index) > 0:
+            match_speaker_id, max_value = self.speaker_index.search(embedding)
+            if max_value >= thr:
+                return match_speaker_id
 
-        match_speaker_id, max_value = max(match_scores.items(), key=lambda item: item[1])
-        if max_value >= thr:
-            return match_speaker_id
+        if clusters is not None:
+            return clusters.assign(embedding)
         else:
             return "guest"
 
-
 if __name__ == '__main__':
     speaker_verifier = SpeakerVerifier()
 
@@ -1,11 +1,131 @@
+import threading
 import warnings
+from collections import deque
 import numpy as np
-import pyloudnorm as pyln
-import librosa
-from clearvoice import ClearVoice
 
 RATE_48K = 48000
 
+# clearvoice、pyloudnorm 和重采样（scipy.signal）导入耗时，创建 SpeechEnhance 时才导入，
+# 可与其他模型的加载并行；会话只创建 EnhanceState 时不需要加载
+ClearVoice = None
+pyln = None
+resample = None
+StreamResampler = None
+# 流式响度的 K 计权滤波，首次计算响度时导入
+lfilter = None
+
+
+def k_weighting_filters(samplerate):
+    """
+    ITU-R BS.1770 K 计权滤波器（高搁架 + 高通），系数计算与 pyloudnorm 一致
+    """
+    filters = []
+    for filter_type, gain_db, q, fc in (("high_shelf", 4.0, 1 / np.sqrt(2), 1500.0), ("high_pass", 0.0, 0.5, 38.0)):
+        A = 10 ** (gain_db / 40.0)
+        w0 = 2.0 * np.pi * (fc / samplerate)
+        alpha = np.sin(w0) / (2.0 * q)
+        if filter_type == "high_shelf":
+            b = [
+                A * ((A + 1) + (A - 1) * np.cos(w0) + 2 * np.sqrt(A) * alpha),
+                -2 * A * ((A - 1) + (A + 1) * np.cos(w0)),
+                A * ((A + 1) + (A - 1) * np.cos(w0) - 2 * np.sqrt(A) * alpha),
+            ]
+            a = [
+                (A + 1) - (A - 1) * np.cos(w0) + 2 * np.sqrt(A) * alpha,
+                2 * ((A - 1) - (A + 1) * np.cos(w0)),
+                (A + 1) - (A - 1) * np.cos(w0) - 2 * np.sqrt(A) * alpha,
+            ]
+        else:
+            b = [(1 + np.cos(w0)) / 2, -(1 + np.cos(w0)), (1 + np.cos(w0)) / 2]
+            a = [1 + alpha, -2 * np.cos(w0), 1 - alpha]
+        b = np.array(b) / a[0]
+        a = np.array(a) / a[0]
+        filters.append((b, a))
+    return filters
+
+
+class LoudnessMeter:
+    """
+    流式门限响度积分器（EBU R128）：K 计权滤波器状态跨块保持，
+    每 100ms 累积一次能量，400ms 块、75% 重叠，绝对门限 -70 LUFS，相对门限 -10 LU。
+    只保留最近 window 秒的块，响度随说话人变化缓慢调整。
+    """
+    def __init__(self, samplerate, window=10.0):
+        self.filters = k_weighting_filters(samplerate)
+        self.hop_size = int(samplerate * 0.1)
+        self.reset(window)
+
+    def reset(self, window=None):
+        if window is not None:
+            self.window = window
+        # 滤波器初始状态为零，与 lfilter_zi(b, a) * 0.0 相同
+        self.filter_states = [np.zeros(max(len(a), len(b)) - 1) for b, a in self.filters]
+        self.residual = np.zeros(0, dtype=np.float64)
+        self.hop_energies = deque(maxlen=max(4, int(self.window * 10)))
+
+    def update(self, audio_np):
+        global lfilter
+        if lfilter is None:
+            from scipy.signal import lfilter
+
+        filtered = np.asarray(audio_np, dtype=np.float64)
+        for i, (b, a) in enumerate(self.filters):
+            filtered, self.filter_states[i] = lfilter(b, a, filtered, zi=self.filter_states[i])
+
+        filtered = np.concatenate([self.residual, filtered])
+        num_hops = len(filtered) // self.hop_size
+        if num_hops > 0:
+            hops = filtered[:num_hops * self.hop_size].reshape(num_hops, self.hop_size)
+            self.hop_energies.extend(np.mean(np.square(hops), axis=1))
+        self.residual = filtered[num_hops * self.hop_size:]
+
+    def integrated_loudness(self):
+        if len(self.hop_energies) < 4:
+            return None
+
+        hops = np.array(self.hop_energies)
+        blocks = (hops[:-3] + hops[1:-2] + hops[2:-1] + hops[3:]) / 4
+        with np.errstate(divide="ignore"):
+            block_loudness = -0.691 + 10 * np.log10(blocks)
+
+        blocks = blocks[block_loudness > -70.0]
+        block_loudness = block_loudness[block_loudness > -70.0]
+        if len(blocks) == 0:
+            return None
+
+        relative_gate = -0.691 + 10 * np.log10(np.mean(blocks)) - 10.0
+        blocks = blocks[block_loudness > relative_gate]
+        if len(blocks) == 0:
+            return None
+
+        return -0.691 + 10 * np.log10(np.mean(blocks))
+
+
+class EnhanceState:
+    """
+    单个会话的流式语音增强状态
+    """
+    def __init__(self, samplerate=16000, loudness_window=10.0):
+        self.loudness_meter = LoudnessMeter(samplerate, loudness_window)
+        self.reset()
+
+    def reset(self):
+        self.break_stream()
+        self.gain = 1.0
+        self.loudness_meter.reset()
+
+    def break_stream(self):
+        """
+        音频不再连续（例如中间的静音块被跳过）时清空上下文，响度状态保留
+        """
+        # 上一块的输入尾部（模型采样率），作为下一块的上下文
+        self.context = None
+        # 上一块输出中尚未发出的尾部（模型采样率），与下一块的重叠部分交叉淡化
+        self.held = None
+        # 输入与模型采样率之间的流式重采样器，首次增强时创建
+        self.upsampler = None
+        self.downsampler = None
+
 
 class SpeechEnhance:
     def __init__(
@@ -14,9 +134,25 @@ class SpeechEnhance:
         target_lufs=-16.0,
         true_peak_limit=-1.0,
         mute_if_too_quiet=True,
-        threshold_dbfs=-50
+        threshold_dbfs=-50,
+        model_samplerate=RATE_48K,
+        context_duration=0.5,
+        overlap_duration=0.05,
     ):
+        global ClearVoice, pyln, resample, StreamResampler
+        if ClearVoice is None:
+            from clearvoice import ClearVoice
+        if pyln is None:
+            import pyloudnorm as pyln
+        if resample is None:
+            from resampler import resample, StreamResampler
+
         self.myClearVoice = ClearVoice(task='speech_enhancement', model_names=[model_name])
+        self.lock = threading.Lock()
+        # 模型采样率，与输入采样率相同时（如 16kHz 模型）跳过重采样
+        self.model_samplerate = model_samplerate
+        self.context_samples = int(context_duration * model_samplerate)
+        self.overlap_samples = min(int(overlap_duration * model_samplerate), self.context_samples)
         self.target_lufs = target_lufs
         self.true_peak_limit = true_peak_limit
         self.mute_if_too_quiet = mute_if_too_quiet
@@ -84,23 +220,129 @@ class SpeechEnhance:
     def clearvoice_enhance(self, audio_np):
         if len(audio_np.shape) < 2:
             audio_np = np.reshape(audio_np, [1, audio_np.shape[0]])
-        audio_enhanced = self.myClearVoice(audio_np)[0,:]
+        with self.lock:
+            audio_enhanced = self.myClearVoice(audio_np)[0,:]
         return np.nan_to_num(audio_enhanced, nan=0.0, posinf=0.0, neginf=0.0)
 
     def enhance(self, audio_np, samplerate):
-        if samplerate != RATE_48K:
-            audio_48k = librosa.resample(audio_np, orig_sr=samplerate, target_sr=RATE_48K)
+        model_samplerate = self.model_samplerate
+        if samplerate != model_samplerate:
+            audio_48k = resample(audio_np, samplerate, model_samplerate)
         else:
             audio_48k = audio_np
 
         audio_48k = self.clearvoice_enhance(audio_48k)
         if self.mute_if_too_quiet:
             audio_48k = self.mute_with_threshold_dbfs(audio_48k)
-        audio_48k = self.normalize_loudness_advanced(audio_48k, RATE_48K)
+        audio_48k = self.normalize_loudness_advanced(audio_48k, model_samplerate)
 
-        if samplerate != RATE_48K:
-            audio_np = librosa.resample(audio_48k, orig_sr=RATE_48K, target_sr=samplerate)
+        if samplerate != model_samplerate:
+            audio_np = resample(audio_48k, model_samplerate, samplerate)
         else:
             audio_np = audio_48k
 
         return audio_np
+
+    def overlap_add(self, audio_model, state):
+        """
+        带上下文增强一块音频：模型输入为上一块的尾部 + 当前块，去掉上下文部分后，
+        与上一块保留的尾部交叉淡化，并保留当前块的尾部等待下一块
+        """
+        if state.context is not None:
+            model_input = np.concatenate([state.context, audio_model])
+        else:
+            model_input = audio_model
+        context_len = len(model_input) - len(audio_model)
+        state.context = model_input[-self.context_samples:]
+
+        enhanced = self.clearvoice_enhance(model_input)
+
+        overlap = self.overlap_samples
+        if state.held is not None and context_len >= len(state.held):
+            # 重叠区域为上一块保留的尾部，线性交叉淡化
+            held_len = len(state.held)
+            fade_in = np.linspace(0.0, 1.0, held_len, dtype=np.float32)
+            head = state.held * (1.0 - fade_in) + enhanced[context_len - held_len:context_len] * fade_in
+            output = np.concatenate([head, enhanced[context_len:]])
+        else:
+            output = enhanced[context_len:]
+
+        if len(output) > overlap:
+            state.held = output[-overlap:]
+            return output[:-overlap]
+        else:
+            state.held = None
+            return output
+
+    def finish_stream(self, state):
+        """
+        音频流中断（预门限跳过静音块）前调用：保留的重叠尾部淡出后，与降采样器中剩余的采样点一起输出，
+        按当前增益调整，否则每句话在静音前都会被截掉 overlap_duration。之后由调用方 break_stream
+        """
+        if state.held is not None:
+            tail = state.held * np.linspace(1.0, 0.0, len(state.held), dtype=np.float32)
+        else:
+            tail = np.zeros(0, dtype=np.float32)
+        state.held = None
+        if state.downsampler is not None:
+            tail = np.concatenate([state.downsampler.process(tail), state.downsampler.flush()])
+        if len(tail) == 0:
+            return tail
+
+        tail = tail * np.float32(state.gain)
+        peak = np.max(np.abs(tail))
+        peak_limit = 10 ** (self.true_peak_limit / 20)
+        if peak > peak_limit:
+            tail = tail * (peak_limit / peak)
+        return np.nan_to_num(tail, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def normalize_loudness_stream(self, audio_np, state):
+        """
+        按会话累积的门限响度调整增益，增益在块内线性过渡，避免块间音量跳变
+        """
+        state.loudness_meter.update(audio_np)
+        loudness = state.loudness_meter.integrated_loudness()
+        gain = state.gain
+        if loudness is not None:
+            gain = 10 ** ((self.target_lufs - loudness) / 20)
+
+        gains = np.linspace(state.gain, gain, len(audio_np), dtype=np.float32)
+        audio_np = audio_np * gains
+        state.gain = gain
+
+        # 峰值限制
+        peak = np.max(np.abs(audio_np)) if len(audio_np) > 0 else 0.0
+        peak_limit = 10 ** (self.true_peak_limit / 20)
+        if peak > peak_limit:
+            audio_np = audio_np * (peak_limit / peak)
+
+        return np.nan_to_num(audio_np, nan=0.0, posinf=0.0, neginf=0.0)
+
+    def enhance_stream(self, audio_np, samplerate, state):
+        """
+        流式语音增强，state 为会话的 EnhanceState，块间保持上下文和响度状态
+        """
+        model_samplerate = self.model_samplerate
+        if samplerate != model_samplerate:
+            if state.upsampler is None:
+                state.upsampler = StreamResampler(samplerate, model_samplerate)
+                state.downsampler = StreamResampler(model_samplerate, samplerate)
+            # 流式重采样，块边界连续
+            audio_model = state.upsampler.process(audio_np)
+        else:
+            audio_model = audio_np
+
+        audio_model = self.overlap_add(np.asarray(audio_model, dtype=np.float32), state)
+
+        if samplerate != model_samplerate:
+            audio_np = state.downsampler.process(audio_model)
+        else:
+            audio_np = audio_model
+
+        if len(audio_np) == 0:
+            return audio_np
+
+        if self.mute_if_too_quiet:
+            audio_np = self.mute_with_threshold_dbfs(audio_np)
+
+        return self.normalize_loudness_stream(audio_np, state)
@@ -0,0 +1,95 @@
+import numpy as np
+
+# 以这些标点结尾的已确认文本视为完整句子
+SENTENCE_END_PUNCTUATIONS = ("。", "！", "？", ".", "!", "?")
+
+
+class StreamingState:
+    """
+    LocalAgreement-2 流式解码状态：连续两次解码结果中相同的前缀词视为已确认，
+    已确认词对应的音频从缓冲区中裁掉，文本作为下一次解码的上文。
+    """
+    def __init__(self, samplerate=16000):
+        self.samplerate = samplerate
+        self.reset()
+
+    def reset(self):
+        # 当前句子中已确认的词，格式：(start, end, word)，时间相对于当前句子起点
+        self.committed_words = []
+        # 上一次解码中未确认的词，用于和下一次解码结果比较
+        self.previous_words = []
+        # 已确认词对应的音频，句子结束时用于说话人识别和保存
+        self.sentence_audio = []
+        # 当前缓冲区起点相对于句子起点的时间，单位：秒
+        self.buffer_offset = 0.0
+
+    @property
+    def committed_text(self):
+        return "".join(word for _, _, word in self.committed_words)
+
+    @property
+    def sentence_duration(self):
+        return self.buffer_offset
+
+    @staticmethod
+    def normalize(word):
+        return word.strip().lower()
+
+    def agree(self, words):
+        """
+        比较本次解码和上一次解码的词序列，返回连续相同的前缀（新确认的词）和剩余未确认的词
+        """
+        agreed = 0
+        for previous, current in zip(self.previous_words, words):
+            if self.normalize(previous[2]) != self.normalize(current[2]):
+                break
+            agreed += 1
+
+        committed = words[:agreed]
+        self.previous_words = words[agreed:]
+        return committed, self.previous_words
+
+    def commit(self, words, audio_buffer):
+        """
+        确认词并从缓冲区裁掉对应的音频，返回新的缓冲区
+        """
+        if len(words) == 0:
+            return audio_buffer
+
+        cut_point = min(len(audio_buffer), int(words[-1][1] * self.samplerate))
+        # audio_buffer 可能是会话缓冲区的视图，确认的音频复制保存
+        self.sentence_audio.append(audio_buffer[:cut_point].copy())
+        self.committed_words.extend(
+            (start + self.buffer_offset, end + self.buffer_offset, word) for start, end, word in words
+        )
+
+        # 未确认的词时间改为相对新缓冲区起点
+        cut_time = cut_point / self.samplerate
+        self.previous_words = [
+            (start - cut_time, end - cut_time, word) for start, end, word in self.previous_words
+        ]
+        self.buffer_offset += cut_time
+
+        return audio_buffer[cut_point:]
+
+    def is_sentence_end(self):
+        return self.committed_text.strip().endswith(SENTENCE_END_PUNCTUATIONS)
+
+    def finish_sentence(self, last_buffer=None):
+        """
+        结束当前句子，返回句子的完整音频，未确认的词保留到下一句
+        """
+        audio_list = list(self.sentence_audio)
+        if last_buffer is not None and len(last_buffer) > 0:
+            audio_list.append(last_buffer)
+
+        if len(audio_list) > 0:
+            sentence_audio = np.concatenate(audio_list)
+        else:
+            sentence_audio = np.array([], dtype=np.float32)
+
+        self.committed_words = []
+        self.sentence_audio = []
+        self.buffer_offset = 0.0
+
+        return sentence_audio
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import math
+import threading
+import logging
+from collections import Counter, deque
+import numpy as np
+from scipy.sparse import csc_matrix
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """
+    多模式子串匹配自动机，一次扫描文本即可判断是否包含任意一个模式串
+    """
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [False]
+
+        for pattern in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] = True
+
+        # 广度优先构建失配指针
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] or self.output[self.fail[next_state]]
+
+    def contains(self, text):
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
+
+
+class FilterEngine:
+    """
+    预编译的幻觉过滤器：find_match 构建 Aho–Corasick 自动机，
+    cos_match 构建固定词表的字符 n-gram TF-IDF 归一化矩阵，每段文本只做一次稀疏矩阵乘向量
+    """
+    def __init__(self, find_match, cos_match, cos_sim, ngram_range=(2, 3)):
+        self.cos_sim = cos_sim
+        self.ngram_range = ngram_range
+        self.automaton = AhoCorasick(find_match)
+
+        docs = [self.ngrams(text) for text in cos_match]
+        self.vocabulary = {}
+        document_frequency = Counter()
+        for doc in docs:
+            document_frequency.update(doc.keys())
+            for gram in doc:
+                self.vocabulary.setdefault(gram, len(self.vocabulary))
+
+        # 与 sklearn 默认一致的平滑 idf，词表外的 n-gram 按只出现 0 次计算
+        num_docs = len(docs)
+        self.idf = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for gram, index in self.vocabulary.items():
+            self.idf[index] = math.log((1 + num_docs) / (1 + document_frequency[gram])) + 1
+        self.unknown_idf = math.log(1 + num_docs) + 1
+
+        rows, cols, values = [], [], []
+        for row, doc in enumerate(docs):
+            weights = {self.vocabulary[gram]: count * self.idf[self.vocabulary[gram]] for gram, count in doc.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+            for col, weight in weights.items():
+                rows.append(row)
+                cols.append(col)
+                values.append(weight / norm)
+        self.matrix = csc_matrix(
+            (np.array(values, dtype=np.float32), (rows, cols)),
+            shape=(num_docs, len(self.vocabulary))
+        )
+
+    def ngrams(self, text):
+        text = "".join(text.lower().split())
+        grams = Counter()
+        min_n, max_n = self.ngram_range
+        for n in range(min_n, max_n + 1):
+            for i in range(len(text) - n + 1):
+                grams[text[i:i+n]] += 1
+        return grams
+
+    def max_similarity(self, text):
+        grams = self.ngrams(text)
+        if len(grams) == 0 or self.matrix.shape[0] == 0:
+            return 0.0
+
+        indices = []
+        weights = []
+        norm = 0.0
+        for gram, count in grams.items():
+            index = self.vocabulary.get(gram)
+            if index is None:
+                norm += (count * self.unknown_idf) ** 2
+            else:
+                weight = count * self.idf[index]
+                norm += weight * weight
+                indices.append(index)
+                weights.append(weight)
+
+        if len(indices) == 0:
+            return 0.0
+
+        scores = self.matrix[:, indices] @ np.array(weights, dtype=np.float32)
+        return float(scores.max()) / math.sqrt(norm)
+
+    def filter(self, text):
+        if not text:
+            return text
+
+        if self.automaton.contains(text):
+            return ""
+
+        if self.max_similarity(text) > self.cos_sim:
+            return ""
+
+        return text
+
+
+class HallucinationFilter:
+    """
+    幻觉过滤器，blacklist_path 文件存在时优先使用文件中的黑名单，文件修改后自动重新加载
+    """
+    def __init__(self, filter_config):
+        self.filter_config = filter_config
+        self.blacklist_path = filter_config.get("blacklist_path")
+        self.reload_interval = filter_config.get("reload_interval", 5)
+        self.lock = threading.Lock()
+
+        self.blacklist_mtime = None
+        self.last_check = 0.0
+        self.engine = self.build()
+
+    def load_blacklist(self):
+        find_match = list(self.filter_config.get("find_match"))
+        cos_match = list(self.filter_config.get("cos_match"))
+
+        if self.blacklist_path and os.path.exists(self.blacklist_path):
+            with open(self.blacklist_path, "r", encoding="utf-8") as f:
+                blacklist = json.load(f)
+            find_match = blacklist.get("find_match", find_match)
+            cos_match = blacklist.get("cos_match", cos_match)
+            self.blacklist_mtime = os.path.getmtime(self.blacklist_path)
+
+        return find_match, cos_match
+
+    def build(self):
+        find_match, cos_match = self.load_blacklist()
+        return FilterEngine(
+            find_match,
+            cos_match,
+            self.filter_config.get("cos_sim"),
+            ngram_range=tuple(self.filter_config.get("ngram_range", (2, 3))),
+        )
+
+    def reload(self):
+        try:
+            engine = self.build()
+        except Exception as e:
+            logger.warning("Reload filter blacklist failed", extra={"fields": {"path": self.blacklist_path, "error": e}})
+            return
+        self.engine = engine
+        logger.info("Reload filter blacklist", extra={"fields": {"path": self.blacklist_path}})
+
+    def check_reload(self):
+        if not self.blacklist_path:
+            return
+
+        now = time.monotonic()
+        if now - self.last_check < self.reload_interval:
+            return
+
+        with self.lock:
+            if now - self.last_check < self.reload_interval:
+                return
+            self.last_check = now
+            if not os.path.exists(self.blacklist_path):
+                return
+            if os.path.getmtime(self.blacklist_path) != self.blacklist_mtime:
+                self.reload()
+
+    def filter(self, text):
+        self.check_reload()
+        return self.engine.filter(text)
@@ -1,77 +1,166 @@
-import os
-import torch
-import scipy
-from itertools import groupby
+import time
+import logging
 import numpy as np
-from pydub import AudioSegment
-import librosa
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from faster_whisper import WhisperModel
+from concurrent.futures import ThreadPoolExecutor
 
 from config import Config
-from speaker_recognize import SpeakerVerifier
-from speech_enhance import SpeechEnhance
+from vad_engine import VadEngine
+from pre_gate import PreGate
+from metrics import metrics
+from decode_budget import DecodeBudget, GREEDY
+
+# 重量级依赖在加载模型时才导入，不同模型的导入和加载在线程中并行进行，
+# 未启用的组件（语音增强、幻觉过滤、繁简转换）不会被导入
+WhisperModel = None
+
+logger = logging.getLogger(__name__)
 
 
 class Transcriptor:
     def __init__(self):
         self.samplerate = 16000
-        self.epoch = 0
         self.load_models(Config.models)
-        self.preheat(Config.preheat_audio)
+
+        if Config.dump.get("audio_save") in ["all", "final"]:
+            from audio_dump import AudioDumpWriter
+            self.audio_dump = AudioDumpWriter(Config.dump, self.samplerate)
+        else:
+            self.audio_dump = None
 
     def load_models(self, models):
-        asr_config = models.get("asr")
-        vad_config = models.get("vad")
+        """
+        各模型互不依赖，在线程池中并行加载，每个模型加载后立即用预热音频预热，
+        依赖其他模型的组件（批量解码、静音预门限）在全部加载完成后创建
+        """
+        import librosa
+        preheat_audio, _ = librosa.load(Config.preheat_audio, sr=self.samplerate, dtype=np.float32)
+
+        self.whisper_config = Config.whisper_config
+        loaders = {
+            "asr": (self.load_asr, models.get("asr"), preheat_audio),
+            "speaker_verifier": (self.load_speaker_verifier, preheat_audio),
+            "vad": (self.load_vad, models.get("vad"), preheat_audio),
+            "speech_enhance": (self.load_speech_enhance, preheat_audio),
+            "filter": (self.load_text_filter,),
+            "opencc": (self.load_cc_model,),
+        }
+        with ThreadPoolExecutor(max_workers=Config.server.get("load_workers"), thread_name_prefix="load") as executor:
+            futures = {name: executor.submit(*loader) for name, loader in loaders.items()}
+            # 任一模型加载失败时抛出异常，由调用方决定退出
+            for name, future in futures.items():
+                logger.info("Model ready", extra={"fields": {"model": name, "seconds": round(future.result(), 2)}})
+
+        batch_config = Config.batch_decode
+        if batch_config.get("enable"):
+            from batch_scheduler import BatchScheduler
+            self.batch_scheduler = BatchScheduler(
+                self.asr_model,
+                Config.whisper_config,
+                max_batch_size=batch_config.get("max_batch_size"),
+                max_wait_ms=batch_config.get("max_wait_ms"),
+            )
+        else:
+            self.batch_scheduler = None
+
+        budget_config = Config.adaptive_decode
+        if budget_config.get("enable") and self.batch_scheduler is None:
+            self.decode_budget = DecodeBudget(budget_config, Config.server.get("inference_workers"))
+        else:
+            self.decode_budget = None
+
+        if Config.pre_gate.get("enable"):
+            self.pre_gate = PreGate(
+                Config.pre_gate,
+                vad_engine=self.vad_engine,
+                min_voice_duration=Config.vad.get("min_voice_duration"),
+            )
+        else:
+            self.pre_gate = None
+
+    def load_asr(self, asr_config, preheat_audio):
+        global WhisperModel
+        start = time.perf_counter()
+        if WhisperModel is None:
+            from faster_whisper import WhisperModel
 
         self.asr_model = WhisperModel(
             model_size_or_path = asr_config["path"],
             device = asr_config["device"],
             local_files_only = False,
-            compute_type = asr_config["compute_type"]
+            compute_type = asr_config["compute_type"],
+            num_workers = asr_config.get("num_workers", 1)
         )
+        self.preheat(preheat_audio)
+        return time.perf_counter() - start
 
+    def load_speaker_verifier(self, preheat_audio):
+        from speaker_recognize import SpeakerVerifier
+        start = time.perf_counter()
         self.speaker_verifier = SpeakerVerifier()
+        self.speaker_verifier.embed(preheat_audio)
+        return time.perf_counter() - start
 
+    def load_vad(self, vad_config, preheat_audio):
+        start = time.perf_counter()
         if Config.vad.get("enable"):
+            import torch
             self.vad_model, _ = torch.hub.load(
                 repo_or_dir = vad_config["path"],
                 model = 'silero_vad',
                 trust_repo = None,
                 source = 'local',
             )
+            self.vad_engine = VadEngine(self.vad_model, Config.vad)
+            self.vad_engine.score(preheat_audio)
         else:
             self.vad_model = None
+            self.vad_engine = None
+        return time.perf_counter() - start
 
+    def load_speech_enhance(self, preheat_audio):
+        start = time.perf_counter()
         se_config = Config.speech_enhance
         if se_config.get("enable"):
+            from speech_enhance import SpeechEnhance
             self.speech_enhance = SpeechEnhance(
                 model_name=se_config.get("model_name"),
                 target_lufs=se_config.get("target_lufs"),
                 true_peak_limit=se_config.get("true_peak_limit"),
                 mute_if_too_quiet=se_config.get("mute_if_too_quiet"),
                 threshold_dbfs=se_config.get("threshold_dbfs"),
+                model_samplerate=se_config.get("model_samplerate"),
+                context_duration=se_config.get("context_duration"),
+                overlap_duration=se_config.get("overlap_duration"),
             )
+            self.speech_enhance.enhance(preheat_audio, self.samplerate)
         else:
             self.speech_enhance = None
+        return time.perf_counter() - start
 
+    def load_text_filter(self):
+        start = time.perf_counter()
         if Config.filter_match.get("enable"):
-            self.vectorizer = TfidfVectorizer()
+            from text_filter import HallucinationFilter
+            self.text_filter = HallucinationFilter(Config.filter_match)
+            self.text_filter.filter("预热")
         else:
-            self.vectorizer = None
+            self.text_filter = None
+        return time.perf_counter() - start
 
-        self.whisper_config = Config.whisper_config
+    def load_cc_model(self):
+        start = time.perf_counter()
         if self.whisper_config.get("tradition_to_simple"):
             import opencc
             self.cc_model = opencc.OpenCC('t2s.json')
+            self.cc_model.convert("預熱")
         else:
             self.cc_model = None
+        return time.perf_counter() - start
 
     def preheat(self, preheat_audio):
-        preheat_audio_, _ = librosa.load(preheat_audio, sr=self.samplerate, dtype=np.float32)
-        self.asr_model.transcribe(
-            preheat_audio_,
+        # transcribe 返回生成器，需要遍历才会真正解码
+        segments, _ = self.asr_model.transcribe(
+            preheat_audio,
             beam_size = self.whisper_config.get("beam_size"),
             best_of = self.whisper_config.get("best_of"),
             patience = self.whisper_config.get("patience"),
@@ -85,100 +174,38 @@ class Transcriptor:
             prefix = self.whisper_config.get("previous_text_prefix"),
             temperature = self.whisper_config.get("temperature"),
         )
-
-    def dump(self, final, audio_buffer):
-        dump_config = Config.dump
-        save_mode = dump_config.get("audio_save")
-
-        if save_mode not in ["all", "final"]:
-            return
-
-        if save_mode == "final" and not final:
-            return
-
-        audio_dir = dump_config.get("audio_dir")
-        if not os.path.exists(audio_dir):
-            os.makedirs(audio_dir)
-
-        self.epoch += 1
-        audio_path = os.path.join(audio_dir, f"{self.epoch:06d}.wav")
-        scipy.io.wavfile.write(audio_path, rate=self.samplerate, data=audio_buffer)
+        for _ in segments:
+            pass
+
+    def dump(self, final, audio_buffer, session_id=None):
+        """
+        缓存音频交给后台线程写入，不阻塞推理
+        """
+        if self.audio_dump is not None:
+            self.audio_dump.submit(session_id, final, audio_buffer)
+
+    def match_speaker(self, audio, speaker_resolver=None):
+        """
+        识别完整句子的说话人，speaker_resolver 可以替换默认的识别方式，
+        例如使用会话内的聚类，或者先返回临时标签再异步识别
+        """
+        with metrics.timer("stage_seconds", stage="speaker"):
+            if speaker_resolver is not None:
+                return speaker_resolver(audio)
+            return self.speaker_verifier.match_speaker(audio)
 
     def vad_rm_silence(self, audio_chunk):
-        vad_config = Config.vad
-
-        vad_flags = []
-        chunk_num = len(audio_chunk) // 512
-        sampling_rate = vad_config.get("sampling_rate")
-        sampling_per_chunk = vad_config.get("sampling_per_chunk")
-
-        for i in range(chunk_num):
-            chunk = audio_chunk[i*sampling_per_chunk:(i+1)*sampling_per_chunk]
-
-            chunk_torch = torch.tensor(chunk).unsqueeze(0)
-            silero_score = self.vad_model(chunk_torch, sampling_rate).item()
-
-            # 如果人生检测概率大于阈值，则认为有语音
-            if silero_score > vad_config.get("vad_threshold"):
-                vad_flags.append(1)
-            else:
-                vad_flags.append(0)
-
-        # print("vad_flags: ", vad_flags)
-
-        # 如果语音时间小于最小语音时间，则认为没有语音，直接返回空
-        voice_duration = vad_flags.count(1)
-        if voice_duration < vad_config.get("min_voice_duration"):
-            return None
-
-        # 如果静音时间小于最小静音时间，则认为没有静音，直接返回原始音频
-        silence_duration = vad_flags.count(0)
-        if silence_duration < vad_config.get("min_silence_duration"):
-            return audio_chunk
-
-        # 删除静音部分，但是语音前后均保留 silence_reserve 个采样点
-        silence_reserve = vad_config.get("silence_reserve")
-        # 找到所有语音段的起始和结束位置
-        indices = []
-        for flag, group in groupby(enumerate(vad_flags), lambda x: x[1]):
-            if flag == 1:  # 语音段
-                group = list(group)
-                start = group[0][0]
-                end = group[-1][0]
-                indices.append((start, end))
-
-        # print("indices: ", indices)
-
-        split_chunk = []
-        for start, end in indices:
-            # 计算保留的前后静音区间
-            # print("start: ", (start - silence_reserve), "end: ", (end + 1 + silence_reserve))
-            start_sample = max(0, (start - silence_reserve) * sampling_per_chunk)
-            end_sample = min(len(audio_chunk), (end + 1 + silence_reserve) * sampling_per_chunk)
-            split_chunk.extend(audio_chunk[start_sample:end_sample])
-
-        if len(split_chunk) > 0:
-            return np.array(split_chunk, dtype=np.float32)
-        else:
-            return None
+        return self.vad_engine.remove_silence(audio_chunk)
 
     def filter(self, text):
-        filter_match = Config.filter_match
-
-        for match_text in filter_match.get("find_match"):
-            if text.find(match_text) != -1:
-                return ""
-
-        for match_text in filter_match.get("cos_match"):
-            tfidf_matrix = self.vectorizer.fit_transform([match_text, text])
-
-            cos_sim = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])
-            if cos_sim > filter_match.get("cos_sim"):
-                return ""
-
-        return text
-
-    def transcript(self, audio_buffer, last_speaker, last_sentence):
+        if self.text_filter is None:
+            return text
+        return self.text_filter.filter(text)
+
+    def prompts(self, last_sentence):
+        """
+        根据配置把上一句作为 initial_prompt、hotwords 或 prefix，返回 (initial_prompt, hotwords, prefix)
+        """
         whisper_config = Config.whisper_config
 
         initial_prompt = whisper_config.get("initial_prompt")
@@ -193,12 +220,22 @@ class Transcriptor:
         if whisper_config.get("previous_text_prefix"):
             prefix_text = last_sentence
 
-        interruption_duration = whisper_config.get("interruption_duration")
+        return initial_prompt, hotwords, prefix_text
 
-        segments, info = self.asr_model.transcribe(
+    def asr_transcribe(self, audio_buffer, initial_prompt, hotwords, prefix_text, options=None):
+        """
+        options 覆盖 whisper_config 的 beam_size、best_of，fallback 为 False 时只使用第一个 temperature
+        """
+        whisper_config = Config.whisper_config
+        options = options or {}
+        temperature = whisper_config.get("temperature")
+        if not options.get("fallback", True):
+            temperature = temperature[:1]
+
+        return self.asr_model.transcribe(
             audio_buffer,
-            beam_size = whisper_config.get("beam_size"),
-            best_of = whisper_config.get("best_of"),
+            beam_size = options.get("beam_size", whisper_config.get("beam_size")),
+            best_of = options.get("best_of", whisper_config.get("best_of")),
             patience = whisper_config.get("patience"),
             suppress_blank = whisper_config.get("suppress_blank"),
             repetition_penalty = whisper_config.get("repetition_penalty"),
@@ -208,9 +245,67 @@ class Transcriptor:
             initial_prompt = initial_prompt,
             hotwords = hotwords,
             prefix = prefix_text,
-            temperature = whisper_config.get("temperature"),
+            temperature = temperature,
         )
-        # print("transcript info: ", info)
+
+    def partial_options(self):
+        """
+        实时转录结果的解码设置，None 表示使用 whisper_config 的设置。
+        批量解码有自己的解码设置，不区分实时结果和完整句子
+        """
+        if self.batch_scheduler is not None:
+            return None
+        greedy_partial = Config.low_latency.get("greedy_partial")
+        if self.decode_budget is not None:
+            return self.decode_budget.partial_options(greedy_partial)
+        return GREEDY if greedy_partial else None
+
+    def decode_tier(self):
+        return self.decode_budget.tier_name if self.decode_budget is not None else None
+
+    def final_decode(self, sentence_audio, last_sentence, sentence, partial_options=None):
+        """
+        实时转录结果使用了降级的解码设置时，句子结束后重新解码整句音频：
+        默认使用 whisper_config 的 beam 设置，自适应解码时使用当前档位的完整句子设置
+        """
+        if partial_options is None or len(sentence_audio) == 0:
+            return sentence
+
+        whisper_config = Config.whisper_config
+        final_options = self.decode_budget.final_options() if self.decode_budget is not None else None
+        with metrics.timer("stage_seconds", stage="final_decode"):
+            segments, info = self.asr_transcribe(sentence_audio, *self.prompts(last_sentence), options=final_options)
+            sentence = "".join(
+                segment.text for segment in segments
+                if segment.avg_logprob > whisper_config.get("log_prob_threshold")
+            )
+
+        if whisper_config.get("tradition_to_simple"):
+            sentence = self.cc_model.convert(sentence)
+        return sentence
+
+    def transcript(self, audio_buffer, last_speaker, last_sentence, speaker_resolver=None, session_id=None):
+        whisper_config = Config.whisper_config
+
+        initial_prompt, hotwords, prefix_text = self.prompts(last_sentence)
+        partial_options = self.partial_options()
+
+        interruption_duration = whisper_config.get("interruption_duration")
+
+        # faster-whisper 在迭代 segments 时才解码，计时到取完所有结果为止
+        whisper_start = time.perf_counter()
+        if self.batch_scheduler is not None:
+            # 与其他会话合并为一个批次解码
+            segments = self.batch_scheduler.transcribe(
+                audio_buffer,
+                initial_prompt = initial_prompt,
+                hotwords = hotwords,
+                prefix = prefix_text,
+            )
+        else:
+            segments, info = self.asr_transcribe(
+                audio_buffer, initial_prompt, hotwords, prefix_text, options=partial_options)
+            # print("transcript info: ", info)
 
         final = False
         speaker = last_speaker
@@ -226,6 +321,7 @@ class Transcriptor:
         for segment in segments:
             generated_segments.append(segment)
         num_segments = len(generated_segments)
+        metrics.observe("stage_seconds", time.perf_counter() - whisper_start, stage="whisper")
 
         if num_segments == 0:
             # 如果转录结果为空，则直接返回
@@ -240,16 +336,17 @@ class Transcriptor:
 
             # 如果音频时长超过最大中断时长，则认为中断结束
             if audio_duration > interruption_duration:
-                print(f"Warning: audio buffer over {interruption_duration} seconds, interrupt")
-                speaker = self.speaker_verifier.match_speaker(audio_buffer)
-                sentence = transcript
+                logger.warning("Audio buffer too long, interrupt sentence", extra={"fields": {
+                    "session": session_id, "max_seconds": interruption_duration}})
+                speaker = self.match_speaker(audio_buffer, speaker_resolver)
+                sentence = self.final_decode(audio_buffer, last_sentence, transcript, partial_options)
                 transcript = ""
                 new_buffer = np.array([],dtype=np.float32)
                 final = True
             else:
                 final = False
 
-            self.dump(final, audio_buffer)
+            self.dump(final, audio_buffer, session_id)
         elif num_segments >= 2:
             # 如果有多段，则截取最后一段
             sentence = ""
@@ -264,11 +361,12 @@ class Transcriptor:
             # 截取最后一段音频作为新的音频缓冲区
             cut_point = int(generated_segments[num_segments - 2].end * self.samplerate)
             last_buffer = audio_buffer[:cut_point]
-            speaker = self.speaker_verifier.match_speaker(last_buffer)
+            sentence = self.final_decode(last_buffer, last_sentence, sentence, partial_options)
+            speaker = self.match_speaker(last_buffer, speaker_resolver)
             new_buffer = audio_buffer[cut_point:]
 
             final = True
-            self.dump(final, last_buffer)
+            self.dump(final, last_buffer, session_id)
 
         if whisper_config.get("tradition_to_simple"):
             # 繁体到简体
@@ -276,41 +374,200 @@ class Transcriptor:
 
         return final, speaker, sentence, transcript, new_buffer
 
-    def inference(self, audio_data, last_speaker, last_sentence, last_transcript, last_buffer):
-        if Config.speech_enhance.get("enable"):
-            # 语音增强
-            audio_data = self.speech_enhance.enhance(audio_data, self.samplerate)
+    def transcript_streaming(self, audio_buffer, last_speaker, last_sentence, stream_state, speaker_resolver=None,
+                             session_id=None):
+        """
+        流式解码：只转录未确认的音频，连续两次解码一致的词确认后从缓冲区裁掉，
+        已确认文本作为 initial_prompt 的上文，解码耗时不随句子变长而增长
+        """
+        whisper_config = Config.whisper_config
+        streaming_config = Config.streaming_decode
 
-        if Config.vad.get("enable"):
-            # vad 过滤静音
-            audio_data = self.vad_rm_silence(audio_data)
+        initial_prompt = whisper_config.get("initial_prompt")
+        if whisper_config.get("previous_text_prompt"):
+            initial_prompt += last_sentence
+        # 已确认的音频已经裁掉，已确认文本只能作为上文，不能作为 prefix
+        committed_text = stream_state.committed_text
+        if len(committed_text) > 0:
+            initial_prompt += committed_text[-streaming_config.get("max_prompt_chars"):]
+
+        hotwords = whisper_config.get("hotwords_text")
+        if whisper_config.get("previous_text_hotwords"):
+            hotwords += last_sentence
+
+        interruption_duration = whisper_config.get("interruption_duration")
+
+        whisper_start = time.perf_counter()
+        segments, info = self.asr_model.transcribe(
+            audio_buffer,
+            beam_size = whisper_config.get("beam_size"),
+            best_of = whisper_config.get("best_of"),
+            patience = whisper_config.get("patience"),
+            suppress_blank = whisper_config.get("suppress_blank"),
+            repetition_penalty = whisper_config.get("repetition_penalty"),
+            log_prob_threshold = whisper_config.get("log_prob_threshold"),
+            no_speech_threshold = whisper_config.get("no_speech_threshold"),
+            condition_on_previous_text = whisper_config.get("condition_on_previous_text"),
+            initial_prompt = initial_prompt,
+            hotwords = hotwords,
+            temperature = whisper_config.get("temperature"),
+            word_timestamps = True,
+        )
+
+        # 获取带时间戳的词，时间相对于当前缓冲区起点
+        words = []
+        for segment in segments:
+            if segment.avg_logprob <= whisper_config.get("log_prob_threshold"):
+                continue
+            for word in segment.words or []:
+                words.append((word.start, word.end, word.word))
+        metrics.observe("stage_seconds", time.perf_counter() - whisper_start, stage="whisper")
+
+        committed, unconfirmed = stream_state.agree(words)
+        new_buffer = stream_state.commit(committed, audio_buffer)
+
+        final = False
+        speaker = last_speaker
+        sentence = last_sentence
+        transcript = stream_state.committed_text + "".join(word for _, _, word in unconfirmed)
+
+        if len(new_buffer) / self.samplerate > interruption_duration:
+            # 长时间没有一致的解码结果，全部确认
+            logger.warning("Audio buffer too long, interrupt sentence", extra={"fields": {
+                "session": session_id, "max_seconds": interruption_duration}})
+            stream_state.previous_words = []
+            new_buffer = stream_state.commit(unconfirmed, new_buffer)
+            unconfirmed = []
+
+        if len(stream_state.committed_words) > 0 and (
+                stream_state.is_sentence_end()
+                or stream_state.sentence_duration > interruption_duration
+                or len(unconfirmed) == 0 and len(new_buffer) == 0):
+            # 已确认文本构成完整句子，未确认的词留到下一句
+            sentence = stream_state.committed_text
+            sentence_audio = stream_state.finish_sentence()
+            speaker = self.match_speaker(sentence_audio, speaker_resolver)
+            transcript = "".join(word for _, _, word in unconfirmed)
+            final = True
+            self.dump(final, sentence_audio, session_id)
+        else:
+            self.dump(final, audio_buffer, session_id)
+
+        if whisper_config.get("tradition_to_simple"):
+            # 繁体到简体
+            transcript = self.cc_model.convert(transcript)
+
+        return final, speaker, sentence, transcript, new_buffer
+
+    def inference(self, audio_data, last_speaker, last_sentence, last_transcript, last_buffer,
+                  stream_state=None, speaker_resolver=None, enhance_state=None, gate_stats=None,
+                  silence_tracker=None, audio_ring=None, session_id=None):
+        """
+        audio_ring 为会话的 AudioRingBuffer 时，last_buffer 是它的视图，新的音频直接写入其中，
+        不再每次拼接出新的数组；返回的 new_buffer 由调用方通过 AudioRingBuffer.assign 同步
+        """
+        chunk_duration = len(audio_data) / self.samplerate
+
+        # 预门限：原始音频为静音时跳过增强、VAD 和转录
+        with metrics.timer("stage_seconds", stage="pre_gate"):
+            skipped = self.pre_gate is not None and self.pre_gate.is_silence(audio_data)
+        if gate_stats is not None:
+            gate_stats.update(chunk_duration, skipped)
+
+        if skipped:
+            if enhance_state is not None:
+                if Config.speech_enhance.get("enable") and Config.speech_enhance.get("streaming"):
+                    # 上一块保留的重叠尾部淡出后接到句子末尾，不截断静音前的最后一段语音
+                    tail = self.speech_enhance.finish_stream(enhance_state)
+                    if len(tail) > 0 and len(last_buffer) > 0:
+                        if audio_ring is not None:
+                            last_buffer = audio_ring.extend(tail)
+                        else:
+                            last_buffer = np.concatenate([last_buffer, tail])
+                # 跳过的音频使流式增强的上下文不再连续
+                enhance_state.break_stream()
+            gap_audio = audio_data
+            audio_data = None
+        else:
+            if Config.speech_enhance.get("enable"):
+                # 语音增强
+                with metrics.timer("stage_seconds", stage="enhance"):
+                    if Config.speech_enhance.get("streaming") and enhance_state is not None:
+                        # 流式增强，保持会话的上下文和响度状态
+                        audio_data = self.speech_enhance.enhance_stream(audio_data, self.samplerate, enhance_state)
+                    else:
+                        audio_data = self.speech_enhance.enhance(audio_data, self.samplerate)
+
+            gap_audio = audio_data
+            if Config.vad.get("enable"):
+                # vad 过滤静音
+                with metrics.timer("stage_seconds", stage="vad"):
+                    audio_data = self.vad_rm_silence(audio_data)
+
+        streaming = Config.streaming_decode.get("enable") and stream_state is not None
+
+        if silence_tracker is not None:
+            silence_duration = silence_tracker.update(chunk_duration, audio_data is None)
 
         # 如果 audio_data 为空，不做转录
         if audio_data is None:
-            if len(last_buffer) > 0 and len(last_transcript) > 0:
-                # 如果 last_buffer 不为空，则视为结束，完整句子为 last_transcript ，新的转录结果为空，新的音频缓冲区为空
-                self.dump(True, last_buffer)
-                speaker = self.speaker_verifier.match_speaker(last_buffer)
+            if silence_tracker is not None and silence_duration < Config.low_latency.get("end_silence_duration"):
+                # 音频块比句子结束所需的静音短时，短停顿不结束句子也不转录；
+                # 句子进行中时停顿的音频接入缓冲区，不丢失被切在块边界的短语音
+                if len(last_buffer) > 0:
+                    if audio_ring is not None:
+                        last_buffer = audio_ring.extend(gap_audio)
+                    else:
+                        last_buffer = np.concatenate([last_buffer, gap_audio])
+                return False, last_speaker, last_sentence, last_transcript, last_buffer
+            elif streaming and (len(last_transcript) > 0 or len(stream_state.committed_words) > 0):
+                # 流式解码：已确认和未确认的文本一起作为完整句子
+                sentence_audio = stream_state.finish_sentence(last_buffer)
+                stream_state.previous_words = []
+                self.dump(True, sentence_audio, session_id)
+                speaker = self.match_speaker(sentence_audio, speaker_resolver)
                 new_buffer = np.array([],dtype=np.float32)
                 return True, speaker, last_transcript, "", new_buffer
+            elif len(last_buffer) > 0 and len(last_transcript) > 0:
+                # 如果 last_buffer 不为空，则视为结束，完整句子为 last_transcript ，新的转录结果为空，新的音频缓冲区为空
+                self.dump(True, last_buffer, session_id)
+                sentence = self.final_decode(last_buffer, last_sentence, last_transcript, self.partial_options())
+                speaker = self.match_speaker(last_buffer, speaker_resolver)
+                new_buffer = np.array([],dtype=np.float32)
+                return True, speaker, sentence, "", new_buffer
             else:
                 # 如果 last_buffer 为空，则视为未结束
                 return False, last_speaker, last_sentence, last_transcript, last_buffer
 
         # 合并 last_buffer 和 chunk_audio
-        audio_buffer = np.concatenate([last_buffer, audio_data])
+        if audio_ring is not None:
+            audio_buffer = audio_ring.extend(audio_data)
+        else:
+            audio_buffer = np.concatenate([last_buffer, audio_data])
 
         # 转录，last_sentence 为上一段转录的完整句子，可作为 prompt 或 hotwords
-        final, speaker, sentence, transcript, new_buffer = self.transcript(audio_buffer, last_speaker, last_sentence)
+        with metrics.timer("stage_seconds", stage="transcript"):
+            if streaming:
+                final, speaker, sentence, transcript, new_buffer = self.transcript_streaming(
+                    audio_buffer, last_speaker, last_sentence, stream_state, speaker_resolver, session_id)
+            else:
+                final, speaker, sentence, transcript, new_buffer = self.transcript(
+                    audio_buffer, last_speaker, last_sentence, speaker_resolver, session_id)
 
         # 过滤幻觉词
-        sentence = self.filter(sentence)
-        transcript = self.filter(transcript)
+        with metrics.timer("stage_seconds", stage="filter"):
+            sentence = self.filter(sentence)
+            transcript = self.filter(transcript)
 
         return final, speaker, sentence, transcript, new_buffer
 
 
 if __name__ == "__main__":
+    from pydub import AudioSegment
+    from logger import setup_logging
+
+    setup_logging()
+
     transcriptor = Transcriptor()
 
     # 读取音频文件
@@ -0,0 +1,113 @@
+import threading
+import numpy as np
+
+# torch 导入耗时，创建 VadEngine 时才导入，会话只使用 SilenceTracker 时不需要加载
+torch = None
+
+
+class VadEngine:
+    """
+    Silero VAD 封装：一次调用给整段音频的所有窗口打分，用 NumPy 掩码截取语音段。
+    """
+    def __init__(self, vad_model, vad_config):
+        global torch
+        if torch is None:
+            import torch
+
+        self.vad_model = vad_model
+        self.sampling_rate = vad_config.get("sampling_rate")
+        self.window_size = vad_config.get("sampling_per_chunk")
+        self.threshold = vad_config.get("vad_threshold")
+        self.min_silence_duration = vad_config.get("min_silence_duration")
+        self.min_voice_duration = vad_config.get("min_voice_duration")
+        self.silence_reserve = vad_config.get("silence_reserve")
+        # min_voice_duration 和 min_silence_duration 按 reference_duration 秒的音频块设置，
+        # 更短的音频块（如客户端默认的 320ms）按窗口数等比例缩小，否则句子开头的音频块会被整块丢弃
+        self.reference_windows = int(vad_config.get("reference_duration", 1.0) * self.sampling_rate) // self.window_size
+
+        # silero 模型带有内部状态，多线程推理时需要串行调用
+        self.lock = threading.Lock()
+        # 新版 silero 的 jit 模型提供 audio_forward，在 TorchScript 内部循环所有窗口
+        self.has_audio_forward = hasattr(vad_model, "audio_forward")
+
+    def score(self, audio_chunk):
+        """
+        返回每个窗口的语音概率，长度为 len(audio_chunk) // window_size
+        """
+        num_windows = len(audio_chunk) // self.window_size
+        if num_windows == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        # 截取整数个窗口，reshape 只产生视图，不复制数据
+        audio = np.ascontiguousarray(audio_chunk[:num_windows * self.window_size], dtype=np.float32)
+        windows = torch.from_numpy(audio).view(num_windows, self.window_size)
+
+        with torch.inference_mode(), self.lock:
+            if self.has_audio_forward:
+                scores = self.vad_model.audio_forward(windows.reshape(1, -1), self.sampling_rate)[0]
+            else:
+                self.vad_model.reset_states()
+                scores = torch.cat([
+                    self.vad_model(windows[i:i+1], self.sampling_rate).reshape(-1)
+                    for i in range(num_windows)
+                ])
+
+        return scores.numpy()[:num_windows]
+
+    def scale_windows(self, windows, num_windows):
+        """
+        把按 reference_duration 设置的窗口数换算到 num_windows 个窗口的音频块，至少为 1 个窗口
+        """
+        if num_windows >= self.reference_windows:
+            return windows
+        return max(1, int(np.ceil(windows * num_windows / self.reference_windows)))
+
+    def remove_silence(self, audio_chunk):
+        vad_flags = self.score(audio_chunk) > self.threshold
+
+        # 如果语音时间小于最小语音时间，则认为没有语音，直接返回空
+        voice_duration = int(np.count_nonzero(vad_flags))
+        if voice_duration < self.scale_windows(self.min_voice_duration, len(vad_flags)):
+            return None
+
+        # 如果静音时间小于最小静音时间，则认为没有静音，直接返回原始音频
+        silence_duration = len(vad_flags) - voice_duration
+        if silence_duration < self.scale_windows(self.min_silence_duration, len(vad_flags)):
+            return audio_chunk
+
+        # 找到所有语音段的起始和结束窗口（结束不包含）
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], vad_flags.view(np.int8), [0]))))
+        starts = edges[0::2]
+        ends = edges[1::2]
+
+        # 删除静音部分，但是语音前后均保留 silence_reserve 个窗口，重叠部分只保留一次
+        sample_starts = np.maximum(0, (starts - self.silence_reserve) * self.window_size)
+        sample_ends = np.minimum(len(audio_chunk), (ends + self.silence_reserve) * self.window_size)
+
+        keep_mask = np.zeros(len(audio_chunk), dtype=bool)
+        for start_sample, end_sample in zip(sample_starts, sample_ends):
+            keep_mask[start_sample:end_sample] = True
+
+        split_chunk = np.asarray(audio_chunk, dtype=np.float32)[keep_mask]
+        if len(split_chunk) > 0:
+            return split_chunk
+        else:
+            return None
+
+
+class SilenceTracker:
+    """
+    单个会话的连续静音时长。音频块比句子结束所需的静音短时，累计多个静音块后才结束句子
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.duration = 0.0
+
+    def update(self, chunk_duration, silent):
+        if silent:
+            self.duration += chunk_duration
+        else:
+            self.duration = 0.0
+        return self.duration
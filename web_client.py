@@ -1,25 +1,30 @@
 import queue
+import argparse
 import pyaudio
 import opuslib_next
-import base64
 import json
 import threading
 import websocket
 
+from protocol import PROTOCOL_VERSION, FRAME_AUDIO, pack_frame, supported_encodings, decode_message
+
 SAMPLING_RATE = 16000
 AUDIO_CHANNELS = 1
-AUDIO_FRAME_SIZE = 320  # 每 320 采样点为 1 帧
-AUDIO_DATA_SIZE = 50    # 每 50 帧为 1 秒，每秒 16000 采样点
-RECV_TIMEOUT = 3        # 接收结果超时时间，单位：秒
+AUDIO_FRAME_SIZE = 320  # 每 320 采样点为 1 帧，20ms
+CHUNK_DURATION = 320    # 每次发送的音频时长，单位：毫秒，需为 20 的整数倍
 
 
 class WebClient():
-    def __init__(self, url = "ws://localhost:6002"):
+    def __init__(self, url = "ws://localhost:6002", chunk_duration = CHUNK_DURATION):
         self.frames = []
+        # 每次发送的帧数，例如 320ms 为 16 帧
+        self.frames_per_chunk = max(1, chunk_duration * SAMPLING_RATE // 1000 // AUDIO_FRAME_SIZE)
         self.audio_fifo = queue.Queue()
-        self.recv_fifo = queue.Queue()
 
         self.opus_encoder = opuslib_next.Encoder(SAMPLING_RATE, AUDIO_CHANNELS, opuslib_next.APPLICATION_VOIP)
+        # 带内 FEC：每个包携带上一个包的冗余数据，服务端可以恢复丢失的帧
+        self.opus_encoder.inband_fec = 1
+        self.opus_encoder.packet_loss_perc = 10
         self.ws = websocket.WebSocketApp(url, on_message=self.on_message, on_open=self.on_open)
         print("Client Init")
 
@@ -28,7 +33,7 @@ class WebClient():
         header = len(opus_audio).to_bytes(2, 'big')
         self.frames.append(header + opus_audio)
 
-        if len(self.frames) >= AUDIO_DATA_SIZE:
+        if len(self.frames) >= self.frames_per_chunk:
             self.audio_fifo.put(b"".join(self.frames))
             self.frames = []
 
@@ -37,6 +42,14 @@ class WebClient():
     def on_open(self, ws):
         print("Client connected")
 
+        # 协商协议版本：音频以二进制帧发送，结果优先使用 msgpack
+        hello = {
+            "type": "hello",
+            "protocol": PROTOCOL_VERSION,
+            "encodings": supported_encodings()
+        }
+        ws.send(json.dumps(hello))
+
         send_thread = threading.Thread(target=self.on_audio_process, args=(ws,))
         send_thread.daemon = True
         send_thread.start()
@@ -44,35 +57,38 @@ class WebClient():
     def on_audio_process(self, ws):
         print("On handle audio fifo thread")
 
-        request = {
-            "audio_base64": "",
-            "last_speaker": "guest",
-            "last_sentence": "",
-            "last_transcript": "",
-            "last_buffer_base64": ""
-        }
-
+        seq = 0
         while True:
             opus_audio = self.audio_fifo.get()
-            audio_base64 = base64.b64encode(opus_audio).decode("utf-8")
-            request["audio_base64"] = audio_base64
-
-            message = json.dumps(request)
-            ws.send(message)
-
-            # 获取结果，并更新 request
-            try:
-                result_dict = self.recv_fifo.get(timeout=RECV_TIMEOUT)  # 设置超时时间为2秒
-                request["last_speaker"] = result_dict.get("speaker")
-                request["last_sentence"] = result_dict.get("sentence")
-                request["last_transcript"] = result_dict.get("transcript")
-                request["last_buffer_base64"] = result_dict.get("buffer_base64")
-            except queue.Empty:
-                print(f"Receive result timeout, no data received within {RECV_TIMEOUT} seconds.")
-                continue
+
+            # 转录状态保存在服务端，只需要发送新的音频；不等待结果，服务端落后时会合并积压的音频块
+            ws.send(pack_frame(FRAME_AUDIO, opus_audio, seq=seq), opcode=websocket.ABNF.OPCODE_BINARY)
+            seq = (seq + 1) & 0xFFFFFFFF
 
     def on_message(self, ws, message):
-        result_dict = json.loads(message)
+        result_dict = decode_message(message)
+
+        if result_dict.get("type") == "hello":
+            print(f"Protocol: {result_dict.get('protocol')}, encoding: {result_dict.get('encoding')}")
+            if result_dict.get("status") == "loading":
+                # 服务端仍在加载模型，音频先在服务端排队，就绪后开始返回结果
+                print("Server is loading models, results will start when ready")
+            return
+
+        if result_dict.get("duplicate"):
+            # 重传的音频命中服务端缓存，结果已经显示过
+            return
+
+        if result_dict.get("type") == "error":
+            print("\r\033[K", end="", flush=True)
+            print(f"Server error: {result_dict.get('error')} (seq {result_dict.get('seq')})")
+            return
+
+        if result_dict.get("type") == "speaker_update":
+            # 异步识别的说话人，不对应新的推理结果
+            print("\r\033[K", end="", flush=True)
+            print(f"[sentence {result_dict.get('sentence_id')}] speaker: {result_dict.get('speaker')}")
+            return
 
         try:
             if result_dict.get("final"):
@@ -86,11 +102,14 @@ class WebClient():
             print("receive result end")
             ws.close()
 
-        self.recv_fifo.put(result_dict)
-
 
 if __name__ == "__main__":
-    client = WebClient("ws://localhost:6002")
+    parser = argparse.ArgumentParser(description="麦克风实时转录客户端")
+    parser.add_argument("--url", default="ws://localhost:6002", help="服务端地址")
+    parser.add_argument("--chunk", type=int, default=CHUNK_DURATION, help="每次发送的音频时长，单位：毫秒")
+    args = parser.parse_args()
+
+    client = WebClient(args.url, chunk_duration=args.chunk)
 
     pa = pyaudio.PyAudio()
     stream_in = pa.open(
@@ -1,159 +1,650 @@
 import asyncio
+import argparse
 import websockets
 import base64
-import opuslib_next
 import json
 import time
+import logging
 import numpy as np
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
 
+from config import Config
 from transcriptor import Transcriptor
+from session import Session
+from opus_codec import OpusDecoder
+from result_cache import ResultCache, payload_hash
+from metrics import metrics
+from logger import setup_logging
+from protocol import FRAME_AUDIO, PROTOCOL_VERSION, negotiate, unpack_frame, encode_message
 
 SAMPLING_RATE = 16000
 AUDIO_CHANNELS = 1
-AUDIO_FRAME_SIZE = 320
+AUDIO_FRAME_SIZE = Config.opus.get("frame_size")
+# router.py 转发连接时带上客户端地址
+FORWARDED_HEADER = "X-Forwarded-For"
+
+# 作为脚本运行时 __name__ 为 __main__，日志名固定为 web_server
+logger = logging.getLogger("web_server")
+
+
+def message_size(message):
+    """
+    websocket 消息的字节数，文本帧按 UTF-8 编码计算，len(str) 是字符数
+    """
+    if isinstance(message, str):
+        return len(message.encode("utf-8"))
+    return len(message)
 
 
 class WebServer:
-    def __init__(self):
-        self.transcriptor = Transcriptor()
-        self.opus_decoder = opuslib_next.Decoder(SAMPLING_RATE, AUDIO_CHANNELS)
-        self.opus_encoder = opuslib_next.Encoder(SAMPLING_RATE, AUDIO_CHANNELS, opuslib_next.APPLICATION_VOIP)
-        print("Server Init")
-
-    def encode_opus(self, audio_data):
-        opus_list = []
-
-        # 检查音频数据长度，如果小于一帧或为空，直接返回空字节串
-        if len(audio_data) < AUDIO_FRAME_SIZE:
-            print(f"数据长度小于一帧: {len(audio_data)}, 返回空字节串")
-            return b""
-
-        for i in range(len(audio_data) // AUDIO_FRAME_SIZE):
-            chunk = audio_data[i*AUDIO_FRAME_SIZE:(i+1)*AUDIO_FRAME_SIZE]
-
-            # print(f"编码: {len(chunk)}")
-            opus_audio = self.opus_encoder.encode(chunk.tobytes(), frame_size=AUDIO_FRAME_SIZE)
-            # print(f"编码后: {len(opus_audio)}")
-            header = len(opus_audio).to_bytes(2, 'big')
-            opus_list.append(header + opus_audio)
-
-        return b"".join(opus_list)
-
-    def decode_opus(self, opus_audio):
-        pcm_list = []
-
-        while len(opus_audio) >= 2:  # 至少要有长度头
-            # 读取长度头
-            packet_len = int.from_bytes(opus_audio[:2], 'big')
-            total_packet_size = 2 + packet_len  # 头 + 数据
-
-            if len(opus_audio) < total_packet_size:
-                # 数据不完整，等待更多数据
-                print(f"数据不完整，等待更多数据: {len(opus_audio)}")
-                break
+    def __init__(self, transcriptor=None):
+        """
+        transcriptor 为 None 时由 start 在后台加载模型，加载期间已经可以接受连接，
+        ping 返回 loading 状态，收到的音频在会话队列中等待，模型就绪后再推理
+        """
+        self.transcriptor = None
+
+        # 推理在线程池中执行，避免阻塞 asyncio 事件循环（包括 ping/pong 心跳）
+        self.executor = ThreadPoolExecutor(
+            max_workers=Config.server.get("inference_workers"),
+            thread_name_prefix="inference"
+        )
+        # 异步说话人识别使用单独的线程，按句子顺序识别，不占用推理线程
+        self.async_speaker = Config.server.get("async_speaker")
+        self.speaker_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speaker")
+
+        # 连接中的会话和线程池中排队或执行中的推理数，只在事件循环线程中修改
+        self.sessions = set()
+        self.inflight = 0
+        # 最近的推理结果，客户端重传的音频和请求直接返回缓存的结果
+        self.result_cache = ResultCache(Config.server.get("result_cache_size"))
+        metrics.gauge_func("active_sessions", lambda: len(self.sessions))
+        metrics.gauge_func("inference_inflight", lambda: self.inflight)
+        metrics.gauge_func("pending_audio_seconds", lambda: sum(
+            session.pending_samples for session in list(self.sessions)) / SAMPLING_RATE)
+        metrics.gauge_func("dropped_chunks", lambda: sum(
+            session.dropped_chunks for session in list(self.sessions)))
+        metrics.gauge_func("audio_buffer_bytes", lambda: sum(
+            session.audio_buffer.nbytes for session in list(self.sessions)))
+        metrics.gauge_func("ready", lambda: int(self.ready))
+        metrics.gauge_func("result_cache_entries", lambda: len(self.result_cache.entries))
+        if transcriptor is not None:
+            self.on_ready(transcriptor)
+        logger.info("Server Init")
+
+    @property
+    def ready(self):
+        return self.transcriptor is not None
+
+    def status(self):
+        return "ready" if self.ready else "loading"
+
+    def on_ready(self, transcriptor):
+        self.transcriptor = transcriptor
+        decode_budget = transcriptor.decode_budget
+        if decode_budget is not None:
+            metrics.gauge_func("decode_tier", lambda: decode_budget.tier)
+        # 唤醒加载期间积压了音频的会话
+        for session in list(self.sessions):
+            session.pending_event.set()
+
+    def health(self):
+        return {
+            "status": self.status(),
+            "sessions": len(self.sessions),
+            "inflight": self.inflight,
+            "pending_audio_seconds": round(sum(
+                session.pending_samples for session in list(self.sessions)) / SAMPLING_RATE, 3),
+            "decode_tier": self.transcriptor.decode_tier() if self.ready else None,
+        }
+
+    def process_request(self, connection, request):
+        """
+        GET /health 不升级为 websocket，直接返回负载和就绪状态，供 router.py 和容器健康检查使用
+        """
+        if request.path.split("?")[0] != "/health":
+            return None
+        response = connection.respond(HTTPStatus.OK, encode_message(self.health()) + "\n")
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    async def load_transcriptor(self):
+        """
+        在单独的线程中加载和预热模型，不阻塞事件循环
+        """
+        loop = asyncio.get_running_loop()
+        load_start = time.perf_counter()
+        transcriptor = await loop.run_in_executor(None, Transcriptor)
+        self.on_ready(transcriptor)
+        logger.info("Models ready", extra={"fields": {"load_seconds": round(time.perf_counter() - load_start, 2)}})
+
+    def decode_audio(self, decoder, opus_audio):
+        with metrics.timer("stage_seconds", stage="opus_decode"):
+            return decoder.decode(opus_audio)
+
+    def decode_audio_base64(self, decoder, audio_base64):
+        return self.decode_audio(decoder, base64.b64decode(audio_base64))
+
+    def receive_audio(self, session, seq, opus_audio):
+        """
+        协议 2 的音频帧经过会话的抖动缓冲，返回按顺序可以推理的音频块
+        """
+        with metrics.timer("stage_seconds", stage="opus_decode"):
+            return session.audio_decoder.receive(seq, opus_audio)
+
+    async def receive_frame(self, websocket, session, seq, opus_audio):
+        """
+        带序号的音频帧：重传或重复的帧直接返回缓存的结果，不再推理；
+        仍在抖动缓冲、排队或推理中的重复帧忽略，结果稍后发送；
+        已经推理过但结果不在缓存中的旧帧，或判定为丢失后才到达的帧，回复 stale_seq
+        """
+        audio_hash = payload_hash(opus_audio)
+        cached = self.result_cache.get((session.client_id, seq, audio_hash))
+        if cached is not None:
+            metrics.inc("result_cache_hits_total")
+            await self.send_message(websocket, session, dict(cached, duplicate=True))
+            return
+
+        if session.audio_decoder.is_duplicate(seq):
+            if session.has_frame(seq):
+                metrics.inc("rejected_frames_total", reason="inflight")
+                return
+            metrics.inc("rejected_frames_total", reason="stale")
+            await self.send_message(websocket, session, {"type": "error", "error": "stale_seq", "seq": seq})
+            logger.debug("Stale frame", extra={"fields": {"session": session.session_id, "seq": seq}})
+            return
+
+        session.frame_hashes[seq] = audio_hash
+        for frame_seq, audio_f32 in self.receive_audio(session, seq, opus_audio):
+            session.push_audio(audio_f32, frame_seq, session.frame_hashes.pop(frame_seq, None))
+        self.schedule_flush(session)
+
+    def schedule_flush(self, session):
+        """
+        抖动缓冲中有等待的帧时，jitter_timeout 秒内没有新的帧（客户端停止发送或长时间丢包）就全部输出
+        """
+        session.cancel_flush()
+        if session.audio_decoder.held:
+            session.flush_handle = asyncio.get_running_loop().call_later(
+                Config.opus.get("jitter_timeout"), self.flush_frames, session)
+
+    def flush_frames(self, session):
+        session.flush_handle = None
+        with metrics.timer("stage_seconds", stage="opus_decode"):
+            outputs = session.audio_decoder.flush()
+        for frame_seq, audio_f32 in outputs:
+            session.push_audio(audio_f32, frame_seq, session.frame_hashes.pop(frame_seq, None))
+        logger.debug("Flush jitter buffer", extra={"fields": {"session": session.session_id, "chunks": len(outputs)}})
+
+    def encode_audio(self, encoder, audio_f32):
+        with metrics.timer("stage_seconds", stage="opus_encode"):
+            return encoder.encode((audio_f32 * 32768.0).astype(np.int16))
+
+    def record_inference(self, audio_f32, new_buffer, inference_start):
+        elapsed = time.perf_counter() - inference_start
+        audio_seconds = len(audio_f32) / SAMPLING_RATE
+        metrics.observe("stage_seconds", elapsed, stage="inference")
+        metrics.observe("buffer_seconds", len(new_buffer) / SAMPLING_RATE)
+        metrics.inc("audio_seconds_total", audio_seconds)
+        metrics.inc("inference_seconds_total", elapsed)
+        if audio_seconds > 0:
+            metrics.observe("rtf", elapsed / audio_seconds)
+            if self.transcriptor.decode_budget is not None:
+                self.transcriptor.decode_budget.update_rtf(elapsed / audio_seconds)
+
+    async def run_inference(self, func, *args):
+        loop = asyncio.get_running_loop()
+        decode_budget = self.transcriptor.decode_budget
+        self.inflight += 1
+        if decode_budget is not None:
+            decode_budget.update_queue_depth(self.inflight)
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.inflight -= 1
+            if decode_budget is not None:
+                decode_budget.update_queue_depth(self.inflight)
+
+    def handle_stateless_request(self, session, request):
+        """
+        兼容旧协议：客户端每次回传 last_* 状态和 last_buffer_base64
+        """
+        audio_f32 = self.decode_audio_base64(session.audio_decoder, request["audio_base64"])
+        last_buffer_f32 = self.decode_audio_base64(session.buffer_decoder, request["last_buffer_base64"])
+
+        inference_start = time.perf_counter()
+        final, speaker, sentence, transcript, new_buffer_f32 = self.transcriptor.inference(
+            audio_f32, request["last_speaker"], request["last_sentence"],
+            request["last_transcript"], last_buffer_f32)
+        self.record_inference(audio_f32, new_buffer_f32, inference_start)
+
+        inference_result = {
+            "final": final,
+            "timestamp": int(time.time()),
+            "speaker": speaker,
+            "sentence": sentence,
+            "transcript": transcript,
+            "buffer_base64": base64.b64encode(self.encode_audio(session.buffer_encoder, new_buffer_f32)).decode("utf-8")
+        }
+        if self.transcriptor.decode_budget is not None:
+            inference_result["decode_tier"] = self.transcriptor.decode_tier()
+
+        return inference_result
+
+    def loading_response(self, request):
+        """
+        模型加载期间的旧协议请求：原样返回客户端的缓冲区，客户端保留状态，就绪后继续转录
+        """
+        return {
+            "final": False,
+            "timestamp": int(time.time()),
+            "speaker": request["last_speaker"],
+            "sentence": request["last_sentence"],
+            "transcript": request["last_transcript"],
+            "buffer_base64": request["last_buffer_base64"],
+            "status": "loading",
+        }
+
+    def speaker_resolver(self, session):
+        """
+        同步模式直接识别说话人；异步模式先返回上一个说话人作为临时标签，
+        句子音频留给 process_session 在发送结果后提交给说话人识别线程
+        """
+        speaker_verifier = self.transcriptor.speaker_verifier
+
+        def resolve(audio):
+            if not self.async_speaker:
+                return speaker_verifier.match_speaker(audio, clusters=session.speaker_clusters)
+            # audio 是会话缓冲区的视图，之后会被新的音频覆盖，复制一份留给说话人识别线程
+            session.pending_speaker_audio = audio.copy()
+            return session.current_speaker()
+
+        return resolve
+
+    def handle_session_request(self, session, audio_f32):
+        """
+        精简协议：客户端只发送新的音频，转录状态和音频缓冲区保存在服务端 session 中
+        """
+        inference_start = time.perf_counter()
+        final, speaker, sentence, transcript, new_buffer = self.transcriptor.inference(
+            audio_f32, session.current_speaker(), session.last_sentence,
+            session.last_transcript, session.last_buffer,
+            stream_state=session.stream_state, speaker_resolver=self.speaker_resolver(session),
+            enhance_state=session.enhance_state, gate_stats=session.gate_stats,
+            silence_tracker=session.silence_tracker, audio_ring=session.audio_buffer, session_id=session.session_id)
+        self.record_inference(audio_f32, new_buffer, inference_start)
+        session.update(speaker, sentence, transcript, new_buffer)
+
+        inference_result = {
+            "final": final,
+            "timestamp": int(time.time()),
+            "speaker": speaker,
+            "sentence": sentence,
+            "transcript": transcript,
+        }
+
+        if self.transcriptor.decode_budget is not None:
+            # 当前的解码档位，负载高时实时转录结果的质量会降低
+            inference_result["decode_tier"] = self.transcriptor.decode_tier()
+
+        if final:
+            inference_result["sentence_id"] = session.next_sentence_id()
+            if session.pending_speaker_audio is not None:
+                # 说话人稍后通过 speaker_update 消息更新
+                inference_result["speaker_provisional"] = True
+
+        return inference_result
+
+    def identify_speaker(self, session, audio):
+        with metrics.timer("stage_seconds", stage="speaker_async"):
+            return self.transcriptor.speaker_verifier.match_speaker(audio, clusters=session.speaker_clusters)
+
+    async def send_speaker_update(self, websocket, session, generation, sentence_id, audio):
+        loop = asyncio.get_running_loop()
+        try:
+            speaker = await loop.run_in_executor(self.speaker_executor, self.identify_speaker, session, audio)
+            if session.generation == generation and session.sentence_id == sentence_id:
+                # 仍是最近一句且会话没有重置时，之后的推理使用识别出的说话人；
+                # 在事件循环中记录，推理线程的 update 不会用临时标签覆盖它
+                session.resolved_speaker = (sentence_id, speaker)
+            response = {
+                "type": "speaker_update",
+                "sentence_id": sentence_id,
+                "speaker": speaker
+            }
+            await self.send_message(websocket, session, response)
+            logger.info("Speaker update", extra={"fields": {
+                "session": session.session_id, "sentence_id": sentence_id, "speaker": speaker}})
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.warning("Warning identifying speaker", extra={"fields": {"session": session.session_id, "error": e}})
+
+    def handle_speaker_request(self, session, request):
+        """
+        说话人注册管理：add 注册（同一说话人可注册多段音频），remove 删除，list 列出，
+        promote 把当前会话中的聚类（如 guest_1）提升为命名说话人
+        """
+        speaker_verifier = self.transcriptor.speaker_verifier
+        action = request.get("action")
+        response = {
+            "type": "speaker",
+            "action": action,
+            "result": "pass"
+        }
+
+        if action == "add":
+            # 注册音频是独立的一段流，使用新的解码器
+            decoder = OpusDecoder(SAMPLING_RATE, AUDIO_CHANNELS, frame_size=AUDIO_FRAME_SIZE)
+            audio_f32 = self.decode_audio_base64(decoder, request["audio_base64"])
+            response["added"] = speaker_verifier.register_speaker(request["speaker_id"], audio_f32)
+        elif action == "remove":
+            response["removed"] = speaker_verifier.remove_speaker(request["speaker_id"])
+        elif action == "promote":
+            centroid = None
+            if session.speaker_clusters is not None:
+                centroid = session.speaker_clusters.promote(request["label"], request["speaker_id"])
+            if centroid is not None:
+                speaker_verifier.enroll_embedding(request["speaker_id"], centroid)
+            else:
+                response["result"] = "fail"
+                response["error"] = f"unknown cluster: {request['label']}"
+        elif action != "list":
+            response["result"] = "fail"
+            response["error"] = f"unknown action: {action}"
+
+        response["speakers"] = speaker_verifier.list_speakers()
+        if session.speaker_clusters is not None:
+            response["clusters"] = session.speaker_clusters.list()
+        return response
+
+    async def send_message(self, websocket, session, response):
+        """
+        按会话协商的编码发送消息，协议 1 和 json 编码为紧凑的文本 JSON，msgpack 为二进制帧
+        """
+        message = encode_message(response, session.encoding)
+        await websocket.send(message)
+        metrics.inc("sent_bytes_total", message_size(message))
+
+    async def reply(self, websocket, session, request, response):
+        """
+        回复控制消息，请求带 request_id 时原样返回，客户端据此匹配重发的请求
+        """
+        if "request_id" in request:
+            response["request_id"] = request["request_id"]
+        await self.send_message(websocket, session, response)
+
+    async def send_result(self, websocket, session, inference_result):
+        with metrics.timer("stage_seconds", stage="send"):
+            await self.send_message(websocket, session, inference_result)
+
+        # 完整句子为 info，实时转录结果为 debug，日志在后台线程中格式化输出
+        if inference_result["final"]:
+            logger.info("Sentence", extra={"fields": {
+                "session": session.session_id,
+                "sentence_id": inference_result.get("sentence_id"),
+                "speaker": inference_result["speaker"],
+                "sentence": inference_result["sentence"],
+            }})
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Transcript", extra={"fields": {
+                "session": session.session_id,
+                "transcript": inference_result["transcript"],
+            }})
 
-            # 提取完整包
-            opus_packet = opus_audio[2:total_packet_size]
-            opus_audio = opus_audio[total_packet_size:]  # 移除已处理部分
+    async def reset_session(self, websocket, session):
+        requests, session.reset_requests = session.reset_requests, []
+        session.reset()
+        for request in requests:
+            response = {
+                "type": "reset",
+                "result": "pass"
+            }
+            await self.reply(websocket, session, request, response)
+        logger.info("Reset session", extra={"fields": {"session": session.session_id}})
+
+    async def process_session(self, websocket, session):
+        """
+        按顺序处理单个会话积压的音频和重置请求，同一会话同时只有一个推理任务；
+        重置只在两次推理之间执行，不会与推理线程同时修改转录状态和音频缓冲区
+        """
+        while True:
+            await session.pending_event.wait()
+            session.pending_event.clear()
 
-            # 解码
             try:
-                # print(f"解码: {len(opus_packet)}")
-                pcm = self.opus_decoder.decode(opus_packet, frame_size=AUDIO_FRAME_SIZE)
-                # print(f"解码后: {len(pcm)}")
-                pcm_list.append(pcm)
-            except Exception as e:
-                print(f"解码失败: {e}, 数据长度: {len(opus_packet)}")
-                continue  # 跳过损坏包
+                if session.reset_requests:
+                    await self.reset_session(websocket, session)
+
+                # 模型加载期间音频在会话队列中积压，超出 max_pending_duration 的部分丢弃，就绪后由 on_ready 唤醒
+                if not self.ready:
+                    continue
+
+                audio_f32 = session.pop_audio()
+                if audio_f32 is None:
+                    continue
+
+                generation = session.generation
+                frames = session.inflight_frames
+                try:
+                    inference_result = await self.run_inference(self.handle_session_request, session, audio_f32)
+                finally:
+                    # 推理失败时也清空，否则重传的这些帧会一直被当作推理中而忽略
+                    session.inflight_frames = []
+                if session.generation != generation:
+                    # 推理期间收到 reset，结果属于重置前的音频，丢弃；重置在下一次循环中执行
+                    session.pending_speaker_audio = None
+                    logger.info("Discard result from before reset", extra={"fields": {"session": session.session_id}})
+                    continue
 
-        return b"".join(pcm_list)
+                if frames:
+                    # 合并推理的多个帧共用一个结果，seq 为其中最后一帧，每一帧重传时都返回这个结果
+                    inference_result["seq"] = frames[-1][0]
+                    for seq, audio_hash in frames:
+                        self.result_cache.put((session.client_id, seq, audio_hash), inference_result)
+                await self.send_result(websocket, session, inference_result)
+
+                if session.pending_speaker_audio is not None:
+                    # 结果发送后再识别说话人，speaker_update 一定在对应句子之后到达
+                    asyncio.create_task(self.send_speaker_update(
+                        websocket, session, generation, inference_result["sentence_id"], session.pending_speaker_audio))
+                    session.pending_speaker_audio = None
+            except websockets.exceptions.ConnectionClosed:
+                break
+            except Exception:
+                logger.warning("Warning processing message", exc_info=True, extra={"fields": {"session": session.session_id}})
 
     # 处理客户端消息
     async def handle_client(self, websocket):
-        client_address = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-        print(f"New client connected: {client_address}")
+        client_address = websocket.request.headers.get(FORWARDED_HEADER)
+        if client_address is None:
+            client_address = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
+        logger.info("New client connected", extra={"fields": {"session": client_address}})
+
+        session = Session(
+            client_address,
+            samplerate=SAMPLING_RATE,
+            max_pending_duration=Config.server.get("max_pending_duration"),
+            cluster_config=Config.speaker_cluster if Config.speaker_cluster.get("enable") else None,
+            loudness_window=Config.speech_enhance.get("loudness_window"),
+            opus_config=Config.opus,
+            interruption_duration=Config.whisper_config.get("interruption_duration")
+        )
+        session_task = asyncio.create_task(self.process_session(websocket, session))
+        self.sessions.add(session)
 
         try:
             async for message in websocket:
                 try:
-                    request = json.loads(message)
+                    metrics.inc("received_bytes_total", message_size(message))
+
+                    if isinstance(message, bytes):
+                        # 协议 2：二进制音频帧，不经过 Base64 和 JSON
+                        kind, flags, seq, payload = unpack_frame(message)
+                        metrics.inc("messages_total", type="audio_frame")
+                        if kind == FRAME_AUDIO:
+                            await self.receive_frame(websocket, session, seq, payload)
+                        else:
+                            logger.warning("Unknown frame type", extra={"fields": {
+                                "session": client_address, "kind": kind}})
+                        continue
+
+                    with metrics.timer("stage_seconds", stage="receive"):
+                        request = json.loads(message)
+                    metrics.inc("messages_total", type=request.get("type", "audio"))
+
+                    if "type" in request and request["type"] == "hello":
+                        # 协议协商，回复固定为文本 JSON，之后的消息按协商的编码发送
+                        session.protocol, session.encoding = negotiate(request)
+                        if request.get("client_id"):
+                            session.client_id = str(request["client_id"])
+                        response = {
+                            "type": "hello",
+                            "result": "pass",
+                            "protocol": session.protocol,
+                            "encoding": session.encoding,
+                            "server_protocol": PROTOCOL_VERSION,
+                            "sample_rate": SAMPLING_RATE,
+                            "frame_size": AUDIO_FRAME_SIZE,
+                            "status": self.status(),
+                        }
+                        if "request_id" in request:
+                            response["request_id"] = request["request_id"]
+                        await websocket.send(encode_message(response))
+                        logger.info("Protocol negotiated", extra={"fields": {
+                            "session": client_address, "protocol": session.protocol, "encoding": session.encoding}})
+                        continue
 
                     if "type" in request and request["type"] == "ping":
-                        print(f"Ping request: {request}")
                         response = {
                             "type": "ping",
-                            "result": "pass"
+                            "result": "pass",
+                            "status": self.status()
                         }
-                        await websocket.send(json.dumps(response, ensure_ascii=False, indent=4))
-                        print(f"Ping response: {response}")
+                        await self.reply(websocket, session, request, response)
+                        logger.debug("Ping", extra={"fields": {"session": client_address}})
                         continue
 
-                    request_copy = dict(request)
-                    if "audio_base64" in request_copy:
-                        request_copy["audio_base64"] = (
-                            f"[omitted]..len={len(request_copy['audio_base64'])}"
-                        )
-                    if "last_buffer_base64" in request_copy:
-                        request_copy["last_buffer_base64"] = (
-                            f"[omitted]..len={len(request_copy['last_buffer_base64'])}"
-                        )
-                    print(request_copy)
-
-                    audio_data = np.frombuffer(
-                        self.decode_opus(base64.b64decode(request["audio_base64"])),
-                        dtype=np.int16
-                    )
-                    audio_f32 = audio_data.astype(np.float32) / 32768.0
-
-                    last_speaker = request["last_speaker"]
-                    last_sentence = request["last_sentence"]
-                    last_transcript = request["last_transcript"]
-                    last_buffer = np.frombuffer(
-                        self.decode_opus(base64.b64decode(request["last_buffer_base64"])),
-                        dtype=np.int16
-                    )
-                    last_buffer_f32 = last_buffer.astype(np.float32) / 32768.0
-
-                    final, speaker, sentence, transcript, new_buffer_f32 = self.transcriptor.inference(
-                        audio_f32, last_speaker, last_sentence, last_transcript, last_buffer_f32)
-
-                    new_buffer_i16 = (new_buffer_f32 * 32768.0).astype(np.int16)
-
-                    inference_result = {
-                        "final": final,
-                        "timestamp": int(time.time()),
-                        "speaker": speaker,
-                        "sentence": sentence,
-                        "transcript": transcript,
-                        "buffer_base64": base64.b64encode(self.encode_opus(new_buffer_i16)).decode("utf-8")
-                    }
-
-                    inference_result_copy = dict(inference_result)
-                    if "buffer_base64" in inference_result_copy:
-                        inference_result_copy["buffer_base64"] = (
-                            f"[omitted]..len={len(inference_result_copy['buffer_base64'])}"
-                        )
-                    print(inference_result_copy)
-
-                    await websocket.send(json.dumps(inference_result, ensure_ascii=False, indent=4))
+                    if "type" in request and request["type"] == "reset":
+                        # 清空服务端保存的转录状态，开始新的会话；积压的音频立即丢弃，
+                        # 状态由 process_session 在当前推理结束后重置，之后回复
+                        session.request_reset(request)
+                        # 重置前的结果不再返回，推理中的旧结果在 process_session 中丢弃，不会写入缓存
+                        self.result_cache.drop(session.client_id)
+                        continue
+
+                    if "type" in request and request["type"] == "stats":
+                        response = {
+                            "type": "stats",
+                            "result": "pass",
+                            "status": self.status(),
+                            "stats": session.stats()
+                        }
+                        await self.reply(websocket, session, request, response)
+                        continue
+
+                    if "type" in request and request["type"] == "speaker":
+                        if not self.ready:
+                            response = {
+                                "type": "speaker",
+                                "action": request.get("action"),
+                                "result": "fail",
+                                "error": "loading",
+                                "status": self.status()
+                            }
+                            await self.reply(websocket, session, request, response)
+                            continue
+                        # 提取 embedding 较慢，放到推理线程池中执行
+                        response = await self.run_inference(self.handle_speaker_request, session, request)
+                        await self.reply(websocket, session, request, response)
+                        logger.info("Speaker response", extra={"fields": {
+                            "session": client_address, "action": response["action"], "result": response["result"]}})
+                        continue
+
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Audio request", extra={"fields": {
+                            "session": client_address,
+                            "audio_base64_len": len(request.get("audio_base64", "")),
+                            "last_buffer_base64_len": len(request.get("last_buffer_base64", "")),
+                        }})
+
+                    if "last_buffer_base64" in request:
+                        # 旧协议的请求自带状态，按到达顺序逐个处理
+                        if not self.ready:
+                            await self.send_result(websocket, session, self.loading_response(request))
+                            continue
+                        # 带 request_id 的请求按请求原文缓存结果，重发的请求不再推理
+                        cache_key = None
+                        if "request_id" in request:
+                            cache_key = (session.client_id, request["request_id"], payload_hash(message))
+                            cached = self.result_cache.get(cache_key)
+                            if cached is not None:
+                                metrics.inc("result_cache_hits_total")
+                                await self.send_result(websocket, session, dict(cached, duplicate=True))
+                                continue
+                        inference_result = await self.run_inference(self.handle_stateless_request, session, request)
+                        if cache_key is not None:
+                            inference_result["request_id"] = request["request_id"]
+                            self.result_cache.put(cache_key, inference_result)
+                        await self.send_result(websocket, session, inference_result)
+                    elif "seq" in request:
+                        # 带序号的音频与二进制帧相同，经过重传检查和抖动缓冲
+                        await self.receive_frame(websocket, session, request["seq"], base64.b64decode(request["audio_base64"]))
+                    else:
+                        # 新的音频交给会话队列，由 process_session 按顺序推理
+                        session.push_audio(self.decode_audio_base64(session.audio_decoder, request["audio_base64"]))
                 except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {e}")
-                except Exception as e:
-                    print(f"Warning processing message: {e}")
+                    logger.warning("JSON decode error", extra={"fields": {"session": client_address, "error": e}})
+                except Exception:
+                    logger.warning("Warning processing message", exc_info=True, extra={"fields": {"session": client_address}})
         except websockets.exceptions.ConnectionClosed:
-            print(f"Client disconnected: {client_address}")
-        except Exception as e:
-            print(f"Connection error: {e}")
-
-    async def start(self):
-        async with websockets.serve(self.handle_client, '0.0.0.0', 6002,
-                                    max_size=10*1024*1024,  # 增加最大消息大小到10MB
-                                    ping_interval=20,  # 每20秒发送ping
-                                    ping_timeout=20):  # ping超时时间
-            print("WebSocket server started on ws://0.0.0.0:6002")
+            logger.info("Client disconnected", extra={"fields": {"session": client_address}})
+        except Exception:
+            logger.error("Connection error", exc_info=True, extra={"fields": {"session": client_address}})
+        finally:
+            self.sessions.discard(session)
+            session.cancel_flush()
+            session_task.cancel()
+            logger.info("Session stats", extra={"fields": session.stats()})
+
+    async def start(self, host="0.0.0.0", port=6002, socket_path=None, metrics_port=None):
+        """
+        socket_path 不为 None 时监听 unix socket，作为 router.py 的 worker 运行
+        """
+        if metrics.enable and metrics_port:
+            self.metrics_server = await metrics.serve('0.0.0.0', metrics_port)
+            logger.info("Metrics server started", extra={"fields": {"url": f"http://0.0.0.0:{metrics_port}/metrics"}})
+
+        options = dict(
+            process_request=self.process_request,
+            max_size=10*1024*1024,  # 增加最大消息大小到10MB
+            ping_interval=20,  # 每20秒发送ping
+            ping_timeout=20,  # ping超时时间
+        )
+        if socket_path is not None:
+            server = websockets.unix_serve(self.handle_client, socket_path, **options)
+            address = f"unix:{socket_path}"
+        else:
+            server = websockets.serve(self.handle_client, host, port, **options)
+            address = f"ws://{host}:{port}"
+
+        async with server:
+            logger.info("WebSocket server started", extra={"fields": {"address": address}})
+            if not self.ready:
+                # 加载失败时异常退出，由容器或 router.py 重启
+                await self.load_transcriptor()
             await asyncio.Future()  # 永久运行
 
 
 if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="实时转录服务")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=6002, help="websocket 端口")
+    parser.add_argument("--socket", default=None, help="改为监听 unix socket，由 router.py 启动 worker 时使用")
+    parser.add_argument("--metrics-port", type=int, default=Config.metrics.get("port"), help="运行指标端口")
+    args = parser.parse_args()
+
     server = WebServer()
-    asyncio.run(server.start())
+    asyncio.run(server.start(args.host, args.port, args.socket, args.metrics_port))